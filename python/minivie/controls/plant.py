@@ -26,6 +26,8 @@ import os
 import time
 import logging
 import math
+from functools import lru_cache
+from types import MappingProxyType
 import numpy as np
 
 import mpl.roc as roc
@@ -215,9 +217,9 @@ class Plant(object):
         # integrate roc values
         self.roc_position += self.roc_velocity * self.dt
         self.grasp_position += self.grasp_velocity * self.dt
-        # Apply limits
-        self.roc_position = np.clip(self.roc_position, 0, 1)
-        self.grasp_position = np.clip(self.grasp_position, 0, 1)
+        # Apply limits.  These are scalars, so clamp directly rather than through a numpy call
+        self.roc_position = min(max(self.roc_position, 0.0), 1.0)
+        self.grasp_position = min(max(self.grasp_position, 0.0), 1.0)
 
         # integrate joint positions from velocity commands
         self.joint_position += self.joint_velocity * self.dt
@@ -231,10 +233,36 @@ class Plant(object):
             roc_angles = roc.get_roc_values(self.roc_table[self.grasp_id], self.grasp_position)
             self.joint_position[self.roc_table[self.grasp_id].joints] = roc_angles
 
-        # Apply limits
-        self.joint_position = np.clip(self.joint_position, self.lower_limit, self.upper_limit)
-
-
+        # Apply limits, in place since the velocity integration above already updates joint_position in place
+        np.clip(self.joint_position, self.lower_limit, self.upper_limit, out=self.joint_position)
+
+
+# Map classes to joint id and direction of motion
+# Class Name: (IsGrasp, JointId, Direction, GraspId)
+CLASS_LOOKUP = {
+    'No Movement': (False, None, 0, None),
+    'Shoulder Flexion': (False, MplId.SHOULDER_FE, +1, None),
+    'Shoulder Extension': (False, MplId.SHOULDER_FE, -1, None),
+    'Shoulder Adduction': (False, MplId.SHOULDER_AB_AD, +1, None),
+    'Shoulder Abduction': (False, MplId.SHOULDER_AB_AD, -1, None),
+    'Humeral Internal Rotation': (False, MplId.HUMERAL_ROT, +1, None),
+    'Humeral External Rotation': (False, MplId.HUMERAL_ROT, -1, None),
+    'Elbow Flexion': (False, MplId.ELBOW, +1, None),
+    'Elbow Extension': (False, MplId.ELBOW, -1, None),
+    'Wrist Rotate In': (False, MplId.WRIST_ROT, +1, None),
+    'Wrist Rotate Out': (False, MplId.WRIST_ROT, -1, None),
+    'Wrist Adduction': (False, MplId.WRIST_AB_AD, +1, None),
+    'Wrist Abduction': (False, MplId.WRIST_AB_AD, -1, None),
+    'Wrist Flex In': (False, MplId.WRIST_FE, +1, None),
+    'Wrist Extend Out': (False, MplId.WRIST_FE, -1, None),
+    'Hand Open': (True, None, -1, None),
+    # Rather than listing out all grasps, just list the arm motions.  Unmatched strings will be tried as grasps
+    # 'Spherical Grasp': (True, None, +1, 'Spherical Grasp'),
+    # 'Tip Grasp': (True, None, +1, 'Tip Grasp'),
+}
+
+
+@lru_cache(maxsize=256)
 def class_map(class_name):
     """Provide names for directional motions of joint commands.
 
@@ -242,41 +270,20 @@ def class_map(class_name):
 
      Thus: Elbow Flexion maps to the Elbow Joint in the (+) direction
 
+     Results are cached since this is called on every classifier update.  The returned mapping is shared between
+     callers so it is read-only
+
     @param class_name: provide a string for a desired joint motion
-    @return: dictionary with JointId(int) Direction(int) IsGrasp(bool) GraspId(int)
+    @return: read-only mapping with JointId(int) Direction(int) IsGrasp(bool) GraspId(int)
     """
 
-    # Map classes to joint id and direction of motion
-    # Class Name: (IsGrasp, JointId, Direction, GraspId)
-    class_lookup = {
-        'No Movement': (False, None, 0, None),
-        'Shoulder Flexion': (False, MplId.SHOULDER_FE, +1, None),
-        'Shoulder Extension': (False, MplId.SHOULDER_FE, -1, None),
-        'Shoulder Adduction': (False, MplId.SHOULDER_AB_AD, +1, None),
-        'Shoulder Abduction': (False, MplId.SHOULDER_AB_AD, -1, None),
-        'Humeral Internal Rotation': (False, MplId.HUMERAL_ROT, +1, None),
-        'Humeral External Rotation': (False, MplId.HUMERAL_ROT, -1, None),
-        'Elbow Flexion': (False, MplId.ELBOW, +1, None),
-        'Elbow Extension': (False, MplId.ELBOW, -1, None),
-        'Wrist Rotate In': (False, MplId.WRIST_ROT, +1, None),
-        'Wrist Rotate Out': (False, MplId.WRIST_ROT, -1, None),
-        'Wrist Adduction': (False, MplId.WRIST_AB_AD, +1, None),
-        'Wrist Abduction': (False, MplId.WRIST_AB_AD, -1, None),
-        'Wrist Flex In': (False, MplId.WRIST_FE, +1, None),
-        'Wrist Extend Out': (False, MplId.WRIST_FE, -1, None),
-        'Hand Open': (True, None, -1, None),
-        # Rather than listing out all grasps, just list the arm motions.  Unmatched strings will be tried as grasps
-        # 'Spherical Grasp': (True, None, +1, 'Spherical Grasp'),
-        # 'Tip Grasp': (True, None, +1, 'Tip Grasp'),
-    }
-
-    if class_name in class_lookup:
-        class_info = dict(zip(('IsGrasp', 'JointId', 'Direction', 'GraspId'), class_lookup[class_name]))
+    if class_name in CLASS_LOOKUP:
+        class_info = dict(zip(('IsGrasp', 'JointId', 'Direction', 'GraspId'), CLASS_LOOKUP[class_name]))
     else:
         # Unmatched string.  Assume this is an entry in the ROC table
         class_info = {'IsGrasp': True, 'JointId': None, 'Direction': +1, 'GraspId': class_name}
 
-    return class_info
+    return MappingProxyType(class_info)
 
 
 def main():
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+import numpy as np
 from pyqtgraph.Qt import QtGui, QtCore
 import pyqtgraph as pg
 # Switch to using white background and black foreground
@@ -31,6 +32,12 @@ class SignalViewer(QtCore.QObject):
         # Timer
         self._timer = None
 
+        # Sample number x-axis, built once per buffer length rather than every frame
+        self._sample_num = np.arange(0)
+
+        # Sample count and channel selection at the last redraw, used to skip redraws when nothing changed
+        self._last_drawn = None
+
         # GUI components
         self._qt_app = QtGui.QApplication(sys.argv)
         self._qt_main_widget = QTWindow(self)
@@ -67,6 +74,9 @@ class SignalViewer(QtCore.QObject):
         self._timer = QtCore.QTimer(self)
         self.connect(self._timer, QtCore.SIGNAL("timeout()"), self._update)
 
+        # Connect the redraw slot once, _update only emits the signal
+        self._qt_main_widget.custom_signal.connect(self._update_time_domain)
+
         # TODO: Make _update_figure() method which syncs properties with UI objects
         #self._update_figure()
 
@@ -82,23 +92,33 @@ class SignalViewer(QtCore.QObject):
         # Called by timer object to update GUI
         if self._mode_select == 'Time Domain':
             # Need to update based on signal emit, once gui has started
-            self._qt_main_widget.custom_signal.connect(self._update_time_domain)
             self._qt_main_widget.custom_signal.emit()
 
     def _update_time_domain(self):
 
+        # Skip the redraw if the source has no new samples and the channel selection is unchanged.  Sources without a
+        # sample counter are always redrawn
+        sample_count = getattr(self._signal_source, 'emg_sample_count', None)
+        if sample_count is not None:
+            drawn = (sample_count, tuple(self._selected_channels))
+            if drawn == self._last_drawn:
+                return
+            self._last_drawn = drawn
+
         # Get Data
         # TODO: Add getFilteredData method to signal source
         channel_data = self._signal_source.get_data()
+        if len(self._sample_num) != len(channel_data):
+            self._sample_num = np.arange(1, len(channel_data) + 1)
 
         # Plot data
         for i_channel in range(16):
+            curve = self._qt_main_widget.curves[i_channel]
             if self._selected_channels[i_channel]:  # update curves if selected
-                signal = channel_data[:, i_channel]
-                sample_num = [x+1 for x in range(len(signal))]
-                self._qt_main_widget.curves[i_channel].setData(sample_num, signal)
-            else:  # otherwise make invisible
-                self._qt_main_widget.curves[i_channel].setData([0], [0])
+                curve.setData(self._sample_num, channel_data[:, i_channel])
+                curve.setVisible(True)
+            else:  # otherwise hide, leaving its data untouched so the curve isn't rebuilt every tick
+                curve.setVisible(False)
 
     # Callbacks
     def signal_select_callback(self, sig_idx):
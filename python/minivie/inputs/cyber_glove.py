@@ -10,7 +10,7 @@ import serial
 import socket
 
 
-def main():
+def main(verbose=False):
     port = ("10.132.13.210", 16700)
 
     print('Starting...')
@@ -32,15 +32,15 @@ def main():
     while 1:
         # print('Getting Data')
         # ser.write(b'G')
-        buff = b''
-
-        # Read full response
-        while 1:
-            r = ser.read()
-            if r == b'\x00':
-                print(f'Msg [{len(buff)}] = {buff}')
-                break
-            buff += r
+        # Read full response up to the null terminator.  read_until returns early without the terminator on timeout,
+        # in which case keep reading to complete the message
+        buff = ser.read_until(b'\x00')
+        while not buff.endswith(b'\x00'):
+            buff += ser.read_until(b'\x00')
+        buff = buff[:-1]  # strip terminator
+
+        if verbose:
+            print(f'Msg [{len(buff)}] = {buff}')
         sock.sendto(buff, port)
 
 
@@ -4,18 +4,26 @@ import numpy as np
 
 
 num_samples = 150
-data_buffer = np.zeros((num_samples, 23))
+# Ring buffer of glove samples, head is the row of the newest sample
+data_buffer = np.zeros((num_samples, 23), dtype=np.uint8)
+head = 0
 
 
 def parse(data):
-    global data_buffer
+    global head
     x = np.frombuffer(data, dtype=np.uint8)
-    data_buffer = np.roll(data_buffer, 1, axis=0)
-    data_buffer[:1, :] = x[:23]
+    # Store the new row in place rather than rolling the whole buffer for every packet
+    head = (head - 1) % num_samples
+    data_buffer[head] = x[:23]
 
     print(x)
 
 
+def snapshot():
+    # Return the buffer ordered newest sample first
+    return np.concatenate((data_buffer[head:], data_buffer[:head]))
+
+
 def old():
     # Setup Data Source
     a = Udp(('localhost', 16700))
@@ -54,23 +62,27 @@ def main():
     ax1 = fig.add_subplot(1, 1, 1)
     fig.canvas.set_window_title('CyberGlove Preview')
 
-    global data_buffer
+    # Create the axes and one line per channel once, each frame then only updates the line data.  Channels are
+    # offset by their channel number so they stack
+    channel_offset = np.arange(1, 24)
+    lines = ax1.plot(np.zeros((num_samples, 23)) + channel_offset)
+    ax1.set_xlim((0, num_samples - 1))
+    plt.ylim((0, 50))
+    plt.xlabel('Samples')
+    plt.ylabel('Channel')
+    plt.title('CyberGlove Stream')
 
     def animate(_):
-        d = data_buffer * 0.1
+        d = snapshot()[::-1] * 0.1 + channel_offset
 
-        for iChannel in range(0, 23):
-            d[:, iChannel] = d[::-1, iChannel] + (1 * (iChannel + 1))
-
-        ax1.clear()
-        ax1.plot(d)
-        plt.ylim((0, 50))
-        plt.xlabel('Samples')
-        plt.ylabel('Channel')
-        plt.title('CyberGlove Stream')
+        for iChannel, line in enumerate(lines):
+            line.set_ydata(d[:, iChannel])
         # print('{:0.2f}'.format(m.get_data_rate_emg()))
 
-    ani = animation.FuncAnimation(fig, animate, interval=150)
+        # Return the updated lines so only they are redrawn (blit) over the cached static background
+        return lines
+
+    ani = animation.FuncAnimation(fig, animate, interval=150, blit=True)
     plt.show()
 
 
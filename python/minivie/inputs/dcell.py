@@ -136,37 +136,14 @@ class DCellSerial(SignalInput):
 
     def _readline(self):
         # Method to read incoming serial data, expects each output to end with EOL carriage return
+        # read_until returns once the carriage return is read, or with whatever was read if the port times out, so
+        # the line is collected by pyserial rather than reading one byte per call
         eol_byte = b'\r'  # Define carriage return bytes
-        eol_string = eol_byte.decode()
-        leneol_string = len(eol_string)
-        line = ''
-        # line = bytearray()
-        # line = b''
-        while True:
-            c_byte = self.ser.read(1)  # Read one byte
-            if c_byte:
-                # line += str(c)
-                c_string = c_byte.decode("ascii", "replace")
-                # print('byte:')
-                # print(c_byte)
-                # print('byte.decode("ascii","replace"):')
-                # print(c_string)
-                # print('byte[0]')
-                # print(c_byte[0])
-
-                line += c_string
-                if c_byte == eol_byte:  # Break once EOL, in this case carriage return, is issued
-                    logging.debug('Breaking because of carriage return')
-                    break
-                    
-            else:  # Break if nothing read back
-                # time.sleep(0.05) # dcell manual says response should come within 50ms
-                # timeout occurs on ser.read
-                logging.debug('Breaking because nothing read back')
-                break
-                
-        # print(line[0:-leneol])  # Return line without EOL
-        return line[0:-leneol_string]  # Return line without EOL
+        line = self.ser.read_until(eol_byte).decode("ascii", "replace")
+        if not line.endswith('\r'):
+            logging.debug('DCell read timed out before carriage return')
+
+        return line[0:-len(eol_byte)]  # Return line without EOL
 
     def _set_defaults(self):
         # Set station number to 001
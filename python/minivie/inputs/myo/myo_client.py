@@ -1,4 +1,5 @@
 import struct
+import threading
 import time
 
 import numpy as np
@@ -12,6 +13,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Packet formats, compiled once rather than parsing the format string for every packet
+# EMG bytes are int8 samples and are read directly with np.frombuffer
+MYO_UDP_EXE_IMU = struct.Struct('<4f 3f 3f')  # MyoUdp.exe quaternion, accel, gyro following 8 emg bytes
+MYO_UDP_EXE_PACKET_SIZE = 8 + MYO_UDP_EXE_IMU.size  # MyoUdp.exe emg, quaternion, accel, gyro
+EMG_PACKET_SIZE = 16  # 2 emg samples of 8 channels
+IMU_PACKET = struct.Struct('<10h')  # raw quaternion, accel, gyro
+
+# Scale applied to the raw int16 imu packet values, in packet order
+IMU_SCALE = np.array([1.0 / MYOHW_ORIENTATION_SCALE] * 4 + [1.0 / MYOHW_ACCELEROMETER_SCALE] * 3 +
+                     [1.0 / MYOHW_GYROSCOPE_SCALE] * 3, dtype=np.float32)
+
 
 class MyoUdp(SignalInput):
     """
@@ -37,21 +49,40 @@ class MyoUdp(SignalInput):
         self.num_samples = num_samples
 
         # Default kinematic values
-        self.__quat = (1.0, 0.0, 0.0, 0.0)
-        self.__accel = (0.0, 0.0, 0.0)
-        self.__gyro = (0.0, 0.0, 0.0)
+        # Allocated once, incoming packets are copied into these arrays rather than creating new ones each update
+        self.__quat = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        self.__accel = np.zeros(3, dtype=np.float32)
+        self.__gyro = np.zeros(3, dtype=np.float32)
+
+        # Last rotation matrix and the quaternion it was computed from, reused until the quaternion changes
+        self.__rot_quat = None
+        self.__rot_mat = np.eye(3)
 
         # Default data buffer [nSamples by nChannels]
         # Treat as private.  use get_data to access since it is thread-safe
-        self.__dataEMG = np.zeros((num_samples, 8))
+        # The buffer is a ring, __head is the row of the newest sample.  New samples are written in place rather than
+        # rolling the whole buffer for every packet, get_data returns the samples newest on top
+        # float32 holds the int8 emg exactly at half the memory of the default float64
+        self.__dataEMG = np.zeros((num_samples, 8), dtype=np.float32)
+        self.__head = 0
+        self.__lock = threading.Lock()
 
         # Internal values
         self.__battery_level = -1  # initial value is unknown
         self.__rate_emg = 0.0
         self.__count_emg = 0  # reset counter
         self.__time_emg = 0.0
+        self.__total_emg = 0  # running count of emg samples received, never reset
         self.emg_rate_update_interval = 1.5
 
+        # Packet parsers keyed by packet length
+        self.__parsers = {
+            MYO_UDP_EXE_PACKET_SIZE: self._parse_myo_udp_exe,  # NOTE: This is the packet size for MyoUdp.exe
+            EMG_PACKET_SIZE: self._parse_emg,
+            IMU_PACKET.size: self._parse_imu,
+            1: self._parse_battery,
+        }
+
         self.transport = udp_comms.Udp()
         self.transport.name = 'MyoUdpRcv'
         self.transport.local_addr = get_address(local_addr_str)
@@ -67,75 +98,90 @@ class MyoUdp(SignalInput):
     def parse_messages(self, data):
         """ Convert incoming bytes to emg, quaternion, accel, and ang rate """
 
-        num_emg_samples = 0
-        if len(data) == 48:  # NOTE: This is the packet size for MyoUdp.exe
-            # -------------------------------
-            # Handles data from MyoUdp.exe
-            # -------------------------------
-            # unpack formatted data bytes
-            # Note: these have been scaled in MyoUdp from the raw hardware values
-            output = struct.unpack("8b 4f 3f 3f", data)
-
-            if self.log_handlers is not None:
-                self.log_handlers(output[0:8])
-
-            # Populate EMG Data Buffer (newest on top)
-            self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-            self.__dataEMG[:1, :] = output[:8]  # insert in first buffer entry
-            num_emg_samples = 1
-
-            # IMU Data Update
-            self.__quat = output[8:12]
-            self.__accel = output[12:15]
-            self.__gyro = output[15:18]
-
-        elif len(data) == 16:  # EMG data only
-            #    Myo UNIX  Data packet information:
-            #        <case> 16
-            #            # EMG Samples (8 channels 2 samples per packet)
-
-            output = struct.unpack('16b', data)
-
-            # Populate EMG Data Buffer (newest on top)
-            self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-            self.__dataEMG[:1, :] = output[0:8]  # insert in first buffer entry
-            self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-            self.__dataEMG[:1, :] = output[8:16]  # insert in first buffer entry
-            num_emg_samples = 2
-
-        elif len(data) == 20:  # IMU data only
-            #    Myo UNIX  Data packet information:
-            #        <case> 20
-            #            # IMU sample
-            #            dataInt16 = double(typecast(bytes,'int16'))
-            #            orientation = dataInt16(1:4) ./ MYOHW_ORIENTATION_SCALE
-            #            accelerometer = dataInt16(5:7) ./ MYOHW_ACCELEROMETER_SCALE
-            #            gyroscope = dataInt16(8:10) ./ MYOHW_GYROSCOPE_SCALE
-            # create array of 10 int16
-            output = struct.unpack('10h', data)
-            unscaled = np.array(output, dtype=np.int16)
-
-            self.__quat = np.array(unscaled[0:4], np.float) / MYOHW_ORIENTATION_SCALE
-            self.__accel = np.array(unscaled[4:7], np.float) / MYOHW_ACCELEROMETER_SCALE
-            self.__gyro = np.array(unscaled[7:10], np.float) / MYOHW_GYROSCOPE_SCALE
-
-        elif len(data) == 1:  # BATT Value
-            self.__battery_level = ord(data)
-            msg = f'Socket {self.transport.local_addr} Battery Level: {self.__battery_level}'
-            logger.info(msg)
-
-        else:
-            # incoming data is not of length = 8, 20, 40, or 48
-            logger.warning(f'MyoUdp: Unexpected packet size. len=({len(data)})')
-
-        if num_emg_samples == 0:
-            return
-        else:
-            self.__count_emg += num_emg_samples
+        # Dispatch on packet length, each parser returns the number of emg samples received
+        num_emg_samples = self.__parsers.get(len(data), self._parse_unknown)(data)
+        self.__count_emg += num_emg_samples
+
+    def _parse_myo_udp_exe(self, data):
+        # -------------------------------
+        # Handles data from MyoUdp.exe
+        # -------------------------------
+        # unpack formatted data bytes
+        # Note: these have been scaled in MyoUdp from the raw hardware values
+        emg = np.frombuffer(data, dtype=np.int8, count=8)
+        output = MYO_UDP_EXE_IMU.unpack_from(data, 8)
+
+        if self.log_handlers is not None:
+            self.log_handlers(emg)
+
+        # Populate EMG Data Buffer (newest on top)
+        self.add_emg_sample(emg)
+
+        # IMU Data Update
+        self.__quat[:] = output[0:4]
+        self.__accel[:] = output[4:7]
+        self.__gyro[:] = output[7:10]
+        return 1
+
+    def _parse_emg(self, data):
+        # EMG data only
+        #    Myo UNIX  Data packet information:
+        #        <case> 16
+        #            # EMG Samples (8 channels 2 samples per packet)
+
+        emg = np.frombuffer(data, dtype=np.int8).reshape(2, 8)
+
+        # Populate EMG Data Buffer (newest on top)
+        self.add_emg_sample(emg[0])
+        self.add_emg_sample(emg[1])
+        return 2
+
+    def _parse_imu(self, data):
+        # IMU data only
+        #    Myo UNIX  Data packet information:
+        #        <case> 20
+        #            # IMU sample
+        #            dataInt16 = double(typecast(bytes,'int16'))
+        #            orientation = dataInt16(1:4) ./ MYOHW_ORIENTATION_SCALE
+        #            accelerometer = dataInt16(5:7) ./ MYOHW_ACCELEROMETER_SCALE
+        #            gyroscope = dataInt16(8:10) ./ MYOHW_GYROSCOPE_SCALE
+        # read the 10 little-endian int16 directly and scale them all in one multiply
+        scaled = np.frombuffer(data, dtype='<i2') * IMU_SCALE
+
+        self.__quat[:] = scaled[0:4]
+        self.__accel[:] = scaled[4:7]
+        self.__gyro[:] = scaled[7:10]
+        return 0
+
+    def _parse_battery(self, data):
+        # BATT Value
+        self.__battery_level = ord(data)
+        msg = f'Socket {self.transport.local_addr} Battery Level: {self.__battery_level}'
+        logger.info(msg)
+        return 0
+
+    def _parse_unknown(self, data):
+        # incoming data is not of length = 1, 16, 20, or 48
+        logger.warning(f'MyoUdp: Unexpected packet size. len=({len(data)})')
+        return 0
+
+    def add_emg_sample(self, sample):
+        """ Insert one 8 channel EMG sample as the newest entry of the ring buffer """
+        with self.__lock:
+            self.__head = (self.__head - 1) % self.num_samples
+            self.__dataEMG[self.__head, :] = sample
+            self.__total_emg += 1
+
+    @property
+    def emg_sample_count(self):
+        """ Total number of EMG samples received, changes whenever get_data would return new data """
+        return self.__total_emg
 
     def get_data(self):
-        """ Return data buffer [nSamples][nChannels] """
-        return self.__dataEMG
+        """ Return data buffer [nSamples][nChannels], newest sample first """
+        with self.__lock:
+            head = self.__head
+            return np.concatenate((self.__dataEMG[head:], self.__dataEMG[:head]))
 
     def get_angles(self):
         """ Return Euler angles computed from Myo quaternion """
@@ -144,12 +190,21 @@ class MyoUdp(SignalInput):
 
     def get_rotationMatrix(self):
         """ Return rotation matrix computed from Myo quaternion"""
+        quat = self.__quat.tobytes()
+        if quat == self.__rot_quat:
+            # No imu update since the last call
+            return self.__rot_mat
+
         rot_mat = quat2mat(self.__quat)
         try:
             [U, s, V] = np.linalg.svd(rot_mat)
-            return np.dot(U, V)
+            rot_mat = np.dot(U, V)
         except:
-            return np.eye(3)
+            rot_mat = np.eye(3)
+
+        self.__rot_quat = quat
+        self.__rot_mat = rot_mat
+        return rot_mat
 
     def get_imu(self):
         """ Return IMU data as a dictionary
@@ -411,7 +411,8 @@ def interactive_startup():
     # Forever loop to get streaming data
     try:
         while True:
-            time.sleep(1 / 300)
+            # Refresh the console monitor at 30Hz, faster than this isn't readable and only adds stdout writes
+            time.sleep(1 / 30)
             a = myo_receiver1.get_data()[:1, :]
             g1, g2, g3 = myo_receiver1.get_angles()
             if num_myo > 1:
@@ -12,6 +12,10 @@ Remove requirement for sudo to do lescan and configure streaming properties (nee
   > sudo apt install libcap2-bin
   > sudo setcap 'cap_net_raw,cap_net_admin+eip' `which hcitool`
 
+Allow the full udp send buffer (SEND_BUFFER_SIZE), the kernel otherwise caps the requested size
+
+  > sudo sysctl -w net.core.wmem_max=4194304
+
 
 Setting up service (on raspberry pi):
 
@@ -63,10 +67,12 @@ Enable the service
 """
 
 import logging
+import os
+import re
+import selectors
 import time
 import socket
 import struct
-import binascii
 from bluepy import btle
 
 from utilities import user_config as uc
@@ -74,6 +80,38 @@ from utilities import get_address
 
 __version__ = "1.1.0"
 
+# Kernel send buffer for the udp stream, so bursts of notifications aren't dropped while the receiver is busy.
+# Linux caps this at net.core.wmem_max
+SEND_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Connection handle in an 'hcitool con' line, e.g. '< LE XX:XX:XX:XX:XX:XX handle 64 state 1 lm MASTER'
+HCITOOL_CON_HANDLE = re.compile(r'handle\s+(\d+)\s+state')
+
+# Myo GATT handles.  Characteristic values deliver notifications, writing the descriptor following each value
+# (un)subscribes from it
+BATTERY_HANDLE = 0x11  # BatteryCharacteristic
+BATTERY_DESCRIPTOR = 0x12
+COMMAND_HANDLE = 0x19  # CommandCharacteristic, mode, sleep and vibration commands
+IMU_HANDLE = 0x1c  # IMUCharacteristic
+IMU_DESCRIPTOR = 0x1d
+CLASSIFIER_DESCRIPTOR = 0x24
+EMG0_HANDLE = 0x2b  # EmgData0Characteristic
+EMG0_DESCRIPTOR = 0x2c
+EMG1_HANDLE = 0x2e  # EmgData1Characteristic
+EMG1_DESCRIPTOR = 0x2f
+EMG2_HANDLE = 0x31  # EmgData2Characteristic
+EMG2_DESCRIPTOR = 0x32
+EMG3_HANDLE = 0x34  # EmgData3Characteristic
+EMG3_DESCRIPTOR = 0x35
+
+# Myo command payloads, packed once
+SUBSCRIBE = struct.pack('<bb', 1, 0)
+UNSUBSCRIBE = struct.pack('<bb', 0, 0)
+SET_MODE_EMG_IMU = struct.pack('<5b', 1, 3, 3, 1, 0)  # Tell the myo we want EMG, IMU
+NEVER_SLEEP = struct.pack('<3b', 9, 1, 1)
+DEEP_SLEEP = struct.pack('<2b', 0x04, 0x01)
+VIBRATE = tuple(struct.pack('<3b', 0x03, 0x01, duration) for duration in range(4))  # indexed by duration 0-3
+
 
 class MyoUdpServer(object):
 
@@ -93,6 +131,8 @@ class MyoUdpServer(object):
         # Create data object handles
         self.peripheral = None
         self.sock = None
+        self.stream_sock = None
+        self.selector = None
         self.delegate = None
         self.thread = None
 
@@ -101,18 +141,23 @@ class MyoUdpServer(object):
         import threading
         import subprocess
 
-        send_udp = lambda data: self.sock.sendto(data, self.remote_port)
-        self.delegate = MyoDelegate(send_udp, self.logger)
+        self.delegate = MyoDelegate(self.send_udp, self.logger)
         self.thread = threading.Thread(target=self.run)
         self.thread.name = self.name
 
-        self.logger.debug('Running subprocess command: hcitool dev')
         hci = 'hci' + str(self.iface)
 
         # Note that if running from startup, you should require bluetooth.target
         # to ensure that the bluetooth device is started
-        output = subprocess.check_output(["hcitool", "dev"])
-        if hci in output.decode('utf-8'):
+        if os.path.isdir('/sys/class/bluetooth'):
+            # Adapters are listed in sysfs, no need to start hcitool
+            found = os.path.isdir('/sys/class/bluetooth/' + hci)
+        else:
+            self.logger.debug('Running subprocess command: hcitool dev')
+            output = subprocess.check_output(["hcitool", "dev"])
+            found = hci in output.decode('utf-8')
+
+        if found:
             self.logger.info('Found device: ' + hci)
         else:
             self.logger.info('Device not found: ' + hci)
@@ -140,18 +185,17 @@ class MyoUdpServer(object):
         # Notifications are unacknowledged, while indications are acknowledged. Notifications are therefore faster,
         # but less reliable.
         # Indication = 0x02; Notification = 0x01
-        import struct
 
         write = self.peripheral.writeCharacteristic
 
         # Setup main streaming:
-        write(0x12, struct.pack('<bb', 1, 0), 1)  # Un/subscribe from battery_level notifications
-        write(0x24, struct.pack('<bb', 0, 0), 1)  # Un/subscribe from classifier indications
-        write(0x1d, struct.pack('<bb', 1, 0), 1)  # Subscribe from imu notifications
-        write(0x2c, struct.pack('<bb', 1, 0), 1)  # Subscribe to emg data0 notifications
-        write(0x2f, struct.pack('<bb', 1, 0), 1)  # Subscribe to emg data1 notifications
-        write(0x32, struct.pack('<bb', 1, 0), 1)  # Subscribe to emg data2 notifications
-        write(0x35, struct.pack('<bb', 1, 0), 1)  # Subscribe to emg data3 notifications
+        write(BATTERY_DESCRIPTOR, SUBSCRIBE, 1)  # Un/subscribe from battery_level notifications
+        write(CLASSIFIER_DESCRIPTOR, UNSUBSCRIBE, 1)  # Un/subscribe from classifier indications
+        write(IMU_DESCRIPTOR, SUBSCRIBE, 1)  # Subscribe from imu notifications
+        write(EMG0_DESCRIPTOR, SUBSCRIBE, 1)  # Subscribe to emg data0 notifications
+        write(EMG1_DESCRIPTOR, SUBSCRIBE, 1)  # Subscribe to emg data1 notifications
+        write(EMG2_DESCRIPTOR, SUBSCRIBE, 1)  # Subscribe to emg data2 notifications
+        write(EMG3_DESCRIPTOR, SUBSCRIBE, 1)  # Subscribe to emg data3 notifications
 
         # note: Default values indicated by [] below:
         # [1]Should be for Classifier modes (00,01)
@@ -167,7 +211,7 @@ class MyoUdpServer(object):
         # write(0x19, struct.pack('<bbbbbhbbhb',2,0xa,3,1,0,0x12c,0,0,0x32,0x62), 1)
 
         # turn off sleep
-        write(0x19, struct.pack('<bbb', 9, 1, 1), 1)
+        write(COMMAND_HANDLE, NEVER_SLEEP, 1)
 
     def set_host_parameters(self):
         """
@@ -203,24 +247,29 @@ class MyoUdpServer(object):
         # parse to get our connection handle
         conn_lines = conn_raw.decode('utf-8').split('\n')
 
-        handle_hex = None
+        handle = None
         for conn in conn_lines:
-            if conn.find(self.mac_address) > 0:
-                start = 'handle'
-                end = 'state'
-                handle = int(conn.split(start)[1].split(end)[0])
-                handle_hex = '{:04x}'.format(handle)
+            match = HCITOOL_CON_HANDLE.search(conn)
+            if match and self.mac_address.upper() in conn:
+                handle = int(match.group(1))
                 self.logger.info('MAC: {} is handle {}'.format(self.mac_address, handle))
 
-        if handle_hex is None:
+        if handle is None:
             logging.error('Connection not found while setting adapter rate')
             return
 
-        cmd_str = "hcitool -i hci{} cmd 0x08 0x0013 {} {} 06 00 06 00 00 00 90 01 01 00 07 00".format(
-            self.iface, handle_hex[2:], handle_hex[:2])
-        self.logger.info("Setting host adapter update rate: " + cmd_str)
-        # subprocess.Popen(cmd_str, shell=True)
-        subprocess.run(cmd_str, shell=True)
+        # handle, min and max interval, slave latency, timeout, min and max connection event length
+        params = struct.pack('<7H', handle, 0x0006, 0x0006, 0x0000, 0x0190, 0x0001, 0x0007)
+        self.logger.info("Setting host adapter update rate: hci{} cmd 0x08 0x0013 {}".format(
+            self.iface, params.hex(' ')))
+        try:
+            # Write the command straight to the adapter, avoids starting hcitool for each connection
+            send_hci_command(self.iface, 0x08, 0x0013, params)
+        except (AttributeError, OSError) as e:
+            # No bluetooth socket support or no cap_net_raw for python, so fall back to hcitool
+            self.logger.info('Raw HCI command failed ({}), using hcitool'.format(e))
+            cmd = ['hcitool', '-i', 'hci{}'.format(self.iface), 'cmd', '0x08', '0x0013']
+            subprocess.run(cmd + ['{:02x}'.format(b) for b in params])
 
     def connect(self):
         # connect bluetooth
@@ -239,41 +288,66 @@ class MyoUdpServer(object):
 
         self.set_device_parameters()
 
-        # connect udp
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setblocking(False)
-        self.sock.bind(self.local_port)
+        # connect udp, once.  Reconnecting the myo reuses the bound socket rather than opening another on the same port
+        if self.sock is None:
+            # Myo data is streamed on a socket connected to the remote port, so the destination is resolved once
+            # rather than passed with every packet.  Commands are received separately on the bound local port, since
+            # a connected socket would only accept datagrams from the remote port
+            self.stream_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.stream_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+            self.stream_sock.connect(self.remote_port)
+
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+            self.sock.bind(self.local_port)
+            # Only read the command socket when a message is waiting
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.sock, selectors.EVENT_READ)
 
         # Assign event handler
         self.peripheral.withDelegate(self.delegate)
 
+    def send_udp(self, data):
+        # Stream a packet to the remote port
+        try:
+            self.stream_sock.send(data)
+        except ConnectionRefusedError:
+            # A connected udp socket reports when nothing is listening at the remote port yet, keep streaming
+            pass
+
     def run(self):
 
         # start run loop
         status_msg_rate = 2.0  # seconds
-        t_start = time.time()
+        # monotonic clock so a system clock step (e.g. ntp sync on the pi) can't skew the reported rates
+        t_start = time.monotonic()
 
         while True:
-            t_now = time.time()
+            t_now = time.monotonic()
             t_elapsed = t_now - t_start
 
             #  waitForNotifications(timeout) Blocks until a notification is received from the peripheral
             # or until the given timeout (in seconds) has elapsed
             if not self.peripheral.waitForNotifications(1.0):
                 self.logger.warning('Missed Myo notification.')
-                self.peripheral.writeCharacteristic(0x19, struct.pack('5b', 1, 3, 3, 1, 0), 1)  # Tell the myo we want EMG, IMU
+                # Tell the myo we want EMG, IMU
+                self.peripheral.writeCharacteristic(COMMAND_HANDLE, SET_MODE_EMG_IMU, 1)
 
             if t_elapsed > status_msg_rate:
-                rate_myo = self.delegate.counter['emg'] / t_elapsed
-                rate_imu = self.delegate.counter['imu'] / t_elapsed
-                status = "MAC: %s Port: %d EMG: %4.1f Hz IMU: %4.1f Hz BattEvts: %d" % (
-                    self.mac_address, self.remote_port[1], rate_myo, rate_imu, self.delegate.counter['battery'])
-                self.logger.info(status)
-
-                # reset timer and rate counters
+                # snapshot and reset the rate counters together, then report from the snapshot
+                counter = self.delegate.counter
+                num_emg, num_imu, num_battery = counter['emg'], counter['imu'], counter['battery']
+                num_unknown = counter['unknown']
+                counter['emg'] = 0
+                counter['imu'] = 0
+                counter['unknown'] = 0
                 t_start = t_now
-                self.delegate.counter['emg'] = 0
-                self.delegate.counter['imu'] = 0
+
+                self.logger.info("MAC: %s Port: %d EMG: %4.1f Hz IMU: %4.1f Hz BattEvts: %d",
+                                 self.mac_address, self.remote_port[1], num_emg / t_elapsed, num_imu / t_elapsed,
+                                 num_battery)
+                if num_unknown:
+                    self.logger.warning('Got %d Unknown Notifications', num_unknown)
 
             # Check for receive messages
             #
@@ -292,24 +366,41 @@ class MyoUdpServer(object):
             # sock.sendto(bytearray([0, 2]), ('127.0.0.1', 16001))
             # sock.sendto(bytearray([1]), ('127.0.0.1', 16001))
 
+            if not self.selector.select(timeout=0):
+                continue
+
             try:
                 data, address = self.sock.recvfrom(1024)
-                if (data[0] == 0) & (len(data) == 2):
+                if len(data) == 2 and data[0] == 0:
                     # Send vibration
-                    logging.warning('Sending Myo vibration command')
+                    self.logger.warning('Sending Myo vibration command')
                     duration = int(data[1])
                     if 0 <= duration <= 3:
-                        self.peripheral.writeCharacteristic(0x19, struct.pack('3b', 0x03, 0x01, duration), True)
-                elif (data[0] == 1) & (len(data) == 1):
+                        self.peripheral.writeCharacteristic(COMMAND_HANDLE, VIBRATE[duration], True)
+                elif len(data) == 1 and data[0] == 1:
                     # Send Deep sleep
-                    logging.warning('Sending Myo to deep sleep')
-                    self.peripheral.writeCharacteristic(0x19, struct.pack('2b', 0x04, 0x01), True)
+                    self.logger.warning('Sending Myo to deep sleep')
+                    self.peripheral.writeCharacteristic(COMMAND_HANDLE, DEEP_SLEEP, True)
 
             except BlockingIOError:
                 pass
 
     def close(self):
+        self.selector.close()
         self.sock.close()
+        self.stream_sock.close()
+
+
+def send_hci_command(dev_id, ogf, ocf, params):
+    """
+        Send an HCI command packet on the raw HCI socket of adapter hci<dev_id>
+
+        Equivalent to 'hcitool -i hci<dev_id> cmd <ogf> <ocf> [params]'.  Requires the cap_net_raw capability
+    """
+    opcode = (ogf << 10) | ocf
+    with socket.socket(socket.AF_BLUETOOTH, socket.SOCK_RAW, socket.BTPROTO_HCI) as hci:
+        hci.bind((dev_id,))
+        hci.send(struct.pack('<BHB', 0x01, opcode, len(params)) + params)  # 0x01 = HCI command packet
 
 
 class MyoDelegate(btle.DefaultDelegate):
@@ -321,37 +412,34 @@ class MyoDelegate(btle.DefaultDelegate):
 
     def __init__(self, send_udp, raw_logger=None):
         self.send_udp = send_udp
-        self.counter = {'emg': 0, 'imu': 0, 'battery': 0}
+        self.counter = {'emg': 0, 'imu': 0, 'battery': 0, 'unknown': 0}
         self.logger = raw_logger
+        # Streaming data handles: (log label, counter, samples per notification)
+        self.stream_handles = {
+            EMG0_HANDLE: ('E0', 'emg', 2),
+            EMG1_HANDLE: ('E1', 'emg', 2),
+            EMG2_HANDLE: ('E2', 'emg', 2),
+            EMG3_HANDLE: ('E3', 'emg', 2),
+            IMU_HANDLE: ('IMU', 'imu', 1),
+        }
         super(MyoDelegate, self).__init__()
 
     def handleNotification(self, cHandle, data):
-        if cHandle == 0x2b:  # EmgData0Characteristic
-            self.send_udp(data)
-            self.logger.debug('E0: ' + binascii.hexlify(data).decode('utf-8'))
-            self.counter['emg'] += 2
-        elif cHandle == 0x2e:  # EmgData1Characteristic
-            self.send_udp(data)
-            self.logger.debug('E1: ' + binascii.hexlify(data).decode('utf-8'))
-            self.counter['emg'] += 2
-        elif cHandle == 0x31:  # EmgData2Characteristic
-            self.send_udp(data)
-            self.logger.debug('E2: ' + binascii.hexlify(data).decode('utf-8'))
-            self.counter['emg'] += 2
-        elif cHandle == 0x34:  # EmgData3Characteristic
-            self.send_udp(data)
-            self.logger.debug('E3: ' + binascii.hexlify(data).decode('utf-8'))
-            self.counter['emg'] += 2
-        elif cHandle == 0x1c:  # IMUCharacteristic
+        stream = self.stream_handles.get(cHandle)
+        if stream is not None:
+            label, counter, num_samples = stream
             self.send_udp(data)
-            self.logger.debug('IMU: ' + binascii.hexlify(data).decode('utf-8'))
-            self.counter['imu'] += 1
-        elif cHandle == 0x11:  # BatteryCharacteristic
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('%s: %s', label, data.hex())
+            self.counter[counter] += num_samples
+        elif cHandle == BATTERY_HANDLE:
             self.send_udp(data)
-            self.logger.info('Battery Level: {}'.format(ord(data)))
+            if data:
+                self.logger.info('Battery Level: %d', data[0])
             self.counter['battery'] += 1
         else:
-            self.logger.warning('Got Unknown Notification: %d' % cHandle)
+            # Only counted here, the run loop reports the total with the rates rather than logging every packet
+            self.counter['unknown'] += 1
 
         return
 
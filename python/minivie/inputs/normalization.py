@@ -81,9 +81,13 @@ class MyoNormalization(NormalizationInterface):
 
         if cmd_type == 'Cmd':
             if 'StartNormalizeMyo' in cmd_data:
+                if self.thread is not None and self.thread.is_alive():
+                    # Only start if no normalization already running
+                    logging.warning('Myo normalization already running')
+                    return
                 self.normalized_motion = cmd_data.split('-')[1]
-                self.thread = threading.Thread(target=self.start_normalization())
-                self.thread.name = 'NormalizeMyoPosition'
+                # Pass the method itself so normalization runs on the new thread, not the command handler
+                self.thread = threading.Thread(target=self.start_normalization, name='NormalizeMyoPosition')
                 self.thread.start()
 
             elif 'ResetOrientation' in cmd_data:
@@ -162,6 +166,7 @@ class MyoNormalization(NormalizationInterface):
         timeout = self.timeout
         time_begin = time.time()
         time_elapsed = 0.0
+        last_time_remaining = None  # time_remaining at the last status message
 
         while time_elapsed < timeout:
 
@@ -180,9 +185,11 @@ class MyoNormalization(NormalizationInterface):
                     # update data for output
                     self.add_data(class_name, features)
 
-            # print status
-            time_remaining = str(int(timeout - time_elapsed))
-            self.send_status(f'Normalizing Class: {class_name} - Time Left: {time_remaining} .0 seconds')
+            # print status, only when the whole seconds left changes since most samples would repeat the message
+            time_remaining = int(timeout - time_elapsed)
+            if time_remaining != last_time_remaining:
+                self.send_status(f'Normalizing Class: {class_name} - Time Left: {time_remaining} .0 seconds')
+                last_time_remaining = time_remaining
 
             # Sleep before next assessed classification
             time.sleep(dt)
@@ -194,8 +201,7 @@ class MyoNormalization(NormalizationInterface):
         return True
 
     def send_status(self, status):
-        # Method to send more verbose status updates for command line users and logging purposes
-        print(status)
+        # Method to send more verbose status updates for logging purposes and the web app
         logging.info(status)
         self.trainer.send_message("strNormalizeMyoPosition", status)
 
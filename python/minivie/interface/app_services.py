@@ -99,7 +99,14 @@ class TrainingManagerWebsocket(AppInterface):
         # keep count of skipped messages so we can send at some nominal rate
         self.msg_skip_count = 0
 
-        self.thread = threading.Thread(target=tornado.ioloop.IOLoop.instance().start, name='WebThread')
+        # Messages waiting to be written on the web thread, latest message per id.  Websockets can only be written
+        # from the web thread, so callers on other threads just queue here and the write is scheduled on the io loop
+        self.io_loop = tornado.ioloop.IOLoop.instance()
+        self.pending_msg = {}
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+
+        self.thread = threading.Thread(target=self.io_loop.start, name='WebThread')
 
     def setup(self, port=9090):
         self.application.listen(port)
@@ -122,14 +129,7 @@ class TrainingManagerWebsocket(AppInterface):
 
         if not self.last_msg[msg_id] == msg:
             self.last_msg[msg_id] = msg
-            try:
-                logging.debug(msg_id + ':' + msg)
-                for ws in wss:
-                    ws.write_message(msg_id + ':' + msg)
-
-            except Exception as e:
-                logging.error(e)
-
+            self.queue_message(msg_id, msg)
             return
         else:
             self.msg_skip_count += 1
@@ -139,15 +139,39 @@ class TrainingManagerWebsocket(AppInterface):
 
             # re-send all messages
             for key, val in self.last_msg.items():
-                try:
-                    logging.debug(key + ':' + val)
-                    for ws in wss:
-                        ws.write_message(key + ':' + val)
-                except Exception as e:
-                    logging.error(e)
+                self.queue_message(key, val)
 
             # reset counter
             self.msg_skip_count = 0
 
+    def queue_message(self, msg_id, msg):
+        # Queue a message for the web thread.  A newer message replaces one with the same id that hasn't been sent
+        # yet, so a slow web thread only sends the latest state rather than a backlog of stale messages.  The old entry
+        # is removed first so the replacement moves to the end, keeping messages in the order they were sent
+        with self.pending_lock:
+            self.pending_msg.pop(msg_id, None)
+            self.pending_msg[msg_id] = msg
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        # add_callback is the only io loop method that is safe to call from other threads
+        self.io_loop.add_callback(self.flush_messages)
+
+    def flush_messages(self):
+        # Write all queued messages to the websockets, runs on the web thread
+        with self.pending_lock:
+            pending = self.pending_msg
+            self.pending_msg = {}
+            self.flush_scheduled = False
+
+        for msg_id, msg in pending.items():
+            try:
+                logging.debug('%s:%s', msg_id, msg)
+                for ws in wss:
+                    ws.write_message(msg_id + ':' + msg)
+
+            except Exception as e:
+                logging.error(e)
+
     def close(self):
         pass
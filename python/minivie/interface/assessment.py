@@ -10,12 +10,88 @@ import logging
 import time
 import numpy as np
 import h5py
-import datetime as dtime
 from mpl import JointEnum as MplId
-import random
 from controls.plant import class_map
+from collections import Counter
 from abc import ABCMeta, abstractmethod
 import os.path
+import sys
+
+# Interned to match the interned TrainingData motion names, so decision checks in the wait loops hit the identity
+# fast path of string equality
+NO_MOVEMENT = sys.intern('No Movement')
+NO_DECISION = sys.intern('None')
+
+RAD2DEG = 180.0 / np.pi
+
+# HDF5 chunk cache for the results files, 4 MiB with a prime number of hash slots as recommended by the HDF5 docs
+RDCC_NBYTES = 4 * 1024 * 1024
+RDCC_NSLOTS = 521
+
+# Strings are logged as variable length utf-8 so h5py encodes them on write, rather than a python list of bytes
+UTF8 = h5py.string_dtype('utf-8')
+
+
+def compressed_opts(shape):
+    # create_dataset keyword arguments for compressed sample logs, chunked to the dataset shape up to 1024 per axis
+    # gzip level 1 is used rather than lzf since lzf is h5py specific and can't be read by MATLAB's HDF5 library
+    # HDF5 cannot chunk an empty fixed size dataset, so those are stored contiguous and uncompressed
+    if 0 in shape:
+        return {}
+    return {'chunks': tuple(min(n, 1024) for n in shape), 'compression': 'gzip', 'compression_opts': 1,
+            'shuffle': True}
+
+
+def draw_target_position(rng, current_position, lower_limit, upper_limit, target_error):
+    # Draw a random target uniformly from the positions that are more than 25% of the total range away from the
+    # current position and more than target_error away from either limit.
+    # The valid region is up to two intervals either side of the current position, so draw directly within their
+    # combined length rather than rejection sampling the whole range
+    min_distance = 0.25 * (upper_limit - lower_limit)
+    low = lower_limit + target_error
+    high = upper_limit - target_error
+    if low >= high:
+        # Target error covers the whole range, just use the middle
+        return 0.5 * (lower_limit + upper_limit)
+
+    below_high = min(high, current_position - min_distance)  # valid interval [low, below_high]
+    above_low = max(low, current_position + min_distance)  # valid interval [above_low, high]
+    length_below = max(0.0, below_high - low)
+    length_above = max(0.0, high - above_low)
+    if length_below + length_above == 0.0:
+        # Nothing far enough away, use the allowed position farthest from the current position
+        return low if abs(current_position - low) > abs(current_position - high) else high
+
+    u = rng.uniform(0.0, length_below + length_above)
+    if u < length_below:
+        return low + u
+    return above_low + (u - length_below)
+
+
+def joints_in_target(positions, target_positions, target_errors, out=None):
+    # Flag each position that is strictly within +- target_error of its target position
+    return np.less(np.abs(positions - target_positions), target_errors, out=out)
+
+
+async def sleep_until(deadline):
+    # Sleep until the time.monotonic() deadline.  Loops that advance an absolute deadline by dt each pass sample at
+    # a steady dt, where sleeping dt after the loop body would drift by however long the body takes
+    await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+
+class MovementStart(object):
+    # Two stage start condition shared by the assessments.  The user must first return to 'No Movement', then the
+    # first movement decision after that starts the assessment.  Feed each new class decision to update()
+
+    def __init__(self):
+        self.entered_no_movement = False
+
+    def update(self, class_decision):
+        # Returns True once the assessment should start
+        if class_decision == NO_MOVEMENT:
+            self.entered_no_movement = True
+            return False
+        return self.entered_no_movement and class_decision != NO_DECISION
 
 
 class AssessmentInterface(object):
@@ -33,6 +109,34 @@ class AssessmentInterface(object):
     def save_results(self):
         pass
 
+    def create_decision_event(self):
+        # Create the new decision event.  This must be called from the loop running the assessment (the web thread),
+        # not the vie thread
+        self._loop = asyncio.get_running_loop()
+        self._decision_event = asyncio.Event()
+
+    def on_new_decision(self, class_decision):
+        # Callback from the vie loop thread when the class decision changes.  Wake any waiting assessment on its own
+        # event loop
+        if self._decision_event is not None:
+            self._loop.call_soon_threadsafe(self._decision_event.set)
+
+    def send_status_rate_limited(self, key, fmt, *args, min_interval=0.5, force=False):
+        # Send a repeating progress status at most once every min_interval seconds per key, unless forced.  The
+        # message is only formatted (fmt % args) once it is known to be sent
+        now = time.monotonic()
+        if not force and (now - self._status_times.get(key, -np.inf)) < min_interval:
+            return
+        self._status_times[key] = now
+        self.send_status(fmt % args)
+
+    async def wait_for_decision(self, timeout):
+        # Wait until a new class decision is published or the timeout expires, whichever comes first
+        try:
+            await asyncio.wait_for(self._decision_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
 
 class MotionTester(AssessmentInterface):
     # Method to perform motion tester assessments, communicate results to user
@@ -58,12 +162,15 @@ class MotionTester(AssessmentInterface):
         self.task = None
         self.filename = 'MOTION_TESTER_LOG'
         self.file_ext = '.hdf5'
+        self.h5 = None  # Results file, open while an assessment is running
+        self._class_names = None  # motion names array written to the results file
         self.reset()
 
         # Assessment parameters
         self.repetitions = 3  # Assessment repetitions
         self.max_correct = 10  # Number of correct classifications required to complete assessment
         self.timeout = 5.0  # Time before assessment times out
+        self.dt = 0.1  # Time between assessed classifications, 100ms RIC JAMA
 
         # Initialize data storage lists
         self.target_class = []
@@ -71,7 +178,16 @@ class MotionTester(AssessmentInterface):
         self.correct_decision = []
         self.time_stamp = []
         self.class_id_to_test = []
-        self.data = []  # List of dicts
+        self.target_id = np.zeros((0, 0), dtype=np.int32)  # [trial, sample] motion id being tested
+        self.decision_id = np.zeros((0, 0), dtype=np.int32)  # [trial, sample] motion id classified
+        self.num_samples = np.zeros(0, dtype=np.int32)  # Number of samples logged in each trial
+        self._name_to_id = {}  # Cache of motion name to motion id, built at the start of each assessment
+
+        # Event set (on the assessment event loop) whenever the vie publishes a new class decision
+        self._loop = None
+        self._decision_event = None
+        self.vie.add_decision_handler(self.on_new_decision)
+        self._status_times = {}  # Time each rate limited status message was last sent, by key
 
         # Kill flag
         # self.stop_assessment = False  # deprecated for asyncio task.cancel()
@@ -84,7 +200,17 @@ class MotionTester(AssessmentInterface):
         self.correct_decision = []
         self.time_stamp = []
         self.class_id_to_test = []
-        self.data = []  # List of dicts
+        self.target_id = np.zeros((0, 0), dtype=np.int32)
+        self.decision_id = np.zeros((0, 0), dtype=np.int32)
+        self.num_samples = np.zeros(0, dtype=np.int32)
+
+    def allocate_data(self, num_trials):
+        # Method to preallocate the sample log for an assessment, one row per trial
+        # Each trial samples at most once per dt until timeout, add_data will grow the log if sleep jitter adds more
+        max_samples = int(np.ceil(self.timeout / self.dt)) + 1
+        self.target_id = np.zeros((num_trials, max_samples), dtype=np.int32)
+        self.decision_id = np.zeros((num_trials, max_samples), dtype=np.int32)
+        self.num_samples = np.zeros(num_trials, dtype=np.int32)
 
     def command_string(self, value):
         """
@@ -97,10 +223,10 @@ class MotionTester(AssessmentInterface):
                 StartAssessment
         """
 
-        logging.info('Received new motion tester command:' + value)
+        logging.info('Received new motion tester command:%s', value)
         parsed = value.split(':')
         if not len(parsed) == 2:
-            logging.warning('Invalid motion tester command: ' + value)
+            logging.warning('Invalid motion tester command: %s', value)
             return
         else:
             cmd_type = parsed[0]
@@ -113,8 +239,9 @@ class MotionTester(AssessmentInterface):
                 self.timeout = float(cmd_data.split('-')[2])
                 self.max_correct = int(round(float(cmd_data.split('-')[3])))
 
-                if self.task is not None:
-                    print('Already Started!!!')
+                if self.task is not None and not self.task.done():
+                    # Only one assessment at a time, the storage is shared
+                    logging.warning('Motion Tester already running')
                 else:
                     self.task = asyncio.create_task(self.run_assessment())
 
@@ -147,8 +274,9 @@ class MotionTester(AssessmentInterface):
         try:
             await self.start_assessment()
             self.clear_task()
-        except asyncio.CancelledError:
-            raise
+        finally:
+            # Close the file however the assessment ends, so an abort or error keeps trials already completed
+            self.close_results()
 
     async def start_assessment(self):
         # Method to assess all trained classes
@@ -158,6 +286,9 @@ class MotionTester(AssessmentInterface):
         # Clear assessment data from previous assessments
         self.reset()
 
+        # Wake on class decision changes
+        self.create_decision_event()
+
         # Update progress bar to 0
         self.update_gui_progress(0, 1)
 
@@ -165,11 +296,21 @@ class MotionTester(AssessmentInterface):
         all_class_names = self.vie.TrainingData.motion_names
         totals = self.vie.TrainingData.get_totals()
         trained_classes = [all_class_names[i] for i, e in enumerate(totals) if e != 0]
+        self._name_to_id = {name: i for i, name in enumerate(all_class_names)}
 
         # Remove no movement class
         if 'No Movement' in trained_classes:
             trained_classes.remove('No Movement')
 
+        # Preallocate storage for all trials
+        self.allocate_data(self.repetitions * len(trained_classes))
+
+        # Resolve GUI images once per assessment rather than per class per repetition
+        image_by_class = {c: self.vie.TrainingData.get_motion_image(c) for c in trained_classes + ['No Movement']}
+
+        # Create results file, each trial is saved as soon as it completes
+        self.open_results()
+
         # pause limb during test
         self.vie.pause('All', True)
         self.send_status('Holdout')
@@ -178,11 +319,11 @@ class MotionTester(AssessmentInterface):
             self.send_status('New Motion Tester Assessment Trial')
             for i, i_class in enumerate(trained_classes):
                 # Initiate new class storage "struct"
-                self.class_id_to_test.append(all_class_names.index(i_class))
-                self.data.append({'targetClass': [], 'classDecision': [], 'voteDecision': [], 'emgFrames': []})
+                self.class_id_to_test.append(self._name_to_id[i_class])
 
                 # Assess class
-                is_complete = await self.assess_class(i_class)
+                is_complete = await self.assess_class(i_class, image_by_class[i_class])
+                self.write_trial(len(self.class_id_to_test) - 1)
 
                 if is_complete:
                     self.send_status('Motion Completed!')
@@ -193,8 +334,7 @@ class MotionTester(AssessmentInterface):
                 self.update_gui_progress(i + 1 + i_rep*len(trained_classes), self.repetitions*len(trained_classes))
 
         # Reset GUI to no-motion image
-        image_name = self.vie.TrainingData.get_motion_image('No Movement')
-        self.trainer.send_message("motion_test_setup", image_name)
+        self.trainer.send_message("motion_test_setup", image_by_class['No Movement'])
         # Save out stored data
         self.save_results()
         # Send status
@@ -202,11 +342,13 @@ class MotionTester(AssessmentInterface):
         # Unlock limb
         self.vie.pause('All', False)
 
-    async def assess_class(self, class_name):
+    async def assess_class(self, class_name, image_name=None):
         # Method to assess a single class, display/save results for viewing
+        # image_name is the GUI image for class_name, if known.  Otherwise it is looked up from the training data
 
         # Update GUI image
-        image_name = self.vie.TrainingData.get_motion_image(class_name)
+        if image_name is None:
+            image_name = self.vie.TrainingData.get_motion_image(class_name)
         if image_name:
             self.trainer.send_message("motion_test_setup", image_name)
 
@@ -219,53 +361,64 @@ class MotionTester(AssessmentInterface):
         #     time.sleep(dt)
 
         # Start once user goes to no-movement, then first non- no movement classification is given
-        self.send_status('Testing Class - <b>' + class_name + '</b> <br>Return to "No Movement" and Begin')
-        entered_no_movement = False
+        self.send_status(f'Testing Class - <b>{class_name}</b> <br>Return to "No Movement" and Begin')
+        movement_start = MovementStart()
         while True:
-            current_class = self.vie.output['decision']
-            if current_class == 'No Movement':
-                entered_no_movement = True
-            if (current_class != 'No Movement') and (current_class != 'None') and entered_no_movement:
+            # Clear before reading so a decision published while we check is not missed
+            self._decision_event.clear()
+            if movement_start.update(self.vie.output['decision']):
                 break
-            await asyncio.sleep(0.1)  # Necessary to sleep, otherwise output gets backlogged
+            # Block until the decision changes, the timeout only guards against a missed notification
+            await self.wait_for_decision(1.0)
 
-        dt = 0.1  # 100ms RIC JAMA
+        dt = self.dt
         timeout = self.timeout
-        time_begin = time.time()
+        time_begin = time.monotonic()
         max_correct = self.max_correct
         move_complete = False
         num_correct = 0.0
-        num_wrong = 0.0
+        num_tested = 0
+        last_correct = None  # num_correct at the last status message
         time_elapsed = 0.0
+        deadline = time_begin  # Time of the next sample
+        # Note vie.output is replaced each vie update, so only the vie itself can be bound outside the loop
+        vie = self.vie
+        # Decisions are logged and scored by class id, so resolve the ids up front
+        # No decision (or a decision missing from the class list) is logged as No Movement
+        # TODO: Better fix for this, should 'None' be an available classification in first place?
+        name_to_id = self._name_to_id
+        no_movement_id = name_to_id[NO_MOVEMENT]
+        class_id = name_to_id[class_name]
 
         while not move_complete and (time_elapsed < timeout):
 
-            # get the class
-            current_class = self.vie.output['decision']
-
-            if current_class == class_name:
-                num_correct += 1.0
-
-            else:
-                num_wrong += 1.0
+            # get the class and tally it
+            current_class_id = name_to_id.get(vie.output['decision'], no_movement_id)
+            num_correct += current_class_id == class_id
+            num_tested += 1
 
-            # print status
-            self.send_status('Testing Class -  <b>' + class_name + '</b> <br>' + str(num_correct) + '/' +
-                             str(max_correct) + ' Correct Classifications')
+            # print status, only when the count changes since most samples would repeat the previous message
+            if num_correct != last_correct:
+                self.send_status(f'Testing Class -  <b>{class_name}</b> <br>{num_correct}/{max_correct} '
+                                 f'Correct Classifications')
+                last_correct = num_correct
 
             # update data for output
-            self.add_data(class_name, current_class)
+            self.add_data(class_id, current_class_id)
 
             # determine if move is completed
             if num_correct >= max_correct:
                 move_complete = True
 
-            # Sleep before next assessed classification
-            await asyncio.sleep(dt)
-            time_elapsed = time.time() - time_begin
+            # Sleep before next assessed classification, falling back to now if the loop has overrun a sample
+            deadline = max(deadline + dt, time.monotonic())
+            await sleep_until(deadline)
+            time_elapsed = time.monotonic() - time_begin
 
         # Motion completed, update status
-        self.send_status('Class Assessment - ' + class_name + ' - ' + str(num_correct) + '/' + str(max_correct) + ' Correct Classifications, ' + str(num_wrong) + ' Misclassifications')
+        num_wrong = num_tested - num_correct
+        self.send_status(f'Class Assessment - {class_name} - {num_correct}/{max_correct} Correct Classifications, '
+                         f'{num_wrong} Misclassifications')
 
         return move_complete
 
@@ -274,59 +427,83 @@ class MotionTester(AssessmentInterface):
         self.trainer.send_message("motion_test_update", str(int(round((float(num_correct)/max_correct)*100))))
 
     def send_status(self, status):
-        # Method to send more verbose status updates for command line users and logging purposes
-        print(status)
+        # Method to send more verbose status updates for logging purposes and the web app
         logging.info(status)
         self.trainer.send_message("motion_test_status", status)
 
-    def add_data(self, class_name_to_test, current_class):
+    def add_data(self, class_id_to_test, current_class_id):
         # Method to add data following each assessment
-
-        # TODO: Better fix for this, should 'None' be an available classification in first place?
-        if current_class == 'None':
-            current_class = 'No Movement'
-
-        # Find ids
-        # class_id_to_test = self.vie.TrainingData.motion_names.index(class_name_to_test)
-        # dict_id = self.class_id_to_test.index(class_id_to_test)
-        current_class_id = self.vie.TrainingData.motion_names.index(current_class)
-
-        # Append to data dicts
-        self.data[-1]['targetClass'].append(class_name_to_test)
-        self.data[-1]['classDecision'].append(current_class_id)
-        # TODO: Update the following metadata
-        #self.data[class_id_to_test]['voteDecision'].append([])
-        #self.data[class_id_to_test]['emgFrames'].append([])
-
-    def save_results(self):
-        # Method to save out compiled assessment results in h5df formal, following full assessment
+        # Classes are given as motion ids, see _name_to_id
+
+        # Current trial is the last class started
+        trial = len(self.class_id_to_test) - 1
+        k = self.num_samples[trial]
+        if k == self.target_id.shape[1]:
+            # Out of preallocated samples, double the log length
+            self.target_id = np.pad(self.target_id, ((0, 0), (0, k)))
+            self.decision_id = np.pad(self.decision_id, ((0, 0), (0, k)))
+
+        # Store ids in the sample log
+        self.target_id[trial, k] = class_id_to_test
+        self.decision_id[trial, k] = current_class_id
+        self.num_samples[trial] = k + 1
+        # TODO: Add voteDecision and emgFrames metadata
+
+    def open_results(self):
+        # Method to create the results file at the start of an assessment, trials are then written as they complete
+        # so an aborted assessment keeps all completed trials
         # Mimics struct hierarchy of MATLAB motion tester results
 
-        t = dtime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        t = time.strftime("%Y-%m-%d_%H-%M-%S")
         f = t + '_' + self.filename + self.file_ext
         counter = 1
         while os.path.exists(f):
             f = t + '_' + self.filename + str(counter) + self.file_ext
             counter=counter+1
 
-        h5 = h5py.File(f, 'w')
-        g1 = h5.create_group('TrialLog')
+        self.h5 = h5py.File(f, 'w', rdcc_nbytes=RDCC_NBYTES, rdcc_nslots=RDCC_NSLOTS)
+        g1 = self.h5.create_group('TrialLog')
         g1.attrs['description'] = t + 'Motion Tester Data'
-        encoded = [a.encode('utf8') for a in self.vie.TrainingData.motion_names]
-        g1.create_dataset('AllClassNames', shape=(len(encoded), 1), data=encoded)
-        g1.create_dataset('ClassIdToTest', data=self.class_id_to_test, shape=(len(self.class_id_to_test), 1))
-        g1.create_dataset('MaxCorrect', data=[self.max_correct], shape=(1, 1))
-        g1.create_dataset('Timeout', data=[self.timeout], shape=(1, 1))
+        # Build each dataset as a single typed (n, 1) column array so h5py writes one contiguous block per call
+        # rather than converting python lists element by element.  Header datasets are tiny, so leave them unchunked
+        self._class_names = np.array(self.vie.TrainingData.motion_names, dtype=UTF8)
+        g1.create_dataset('AllClassNames', data=self._class_names.reshape(-1, 1), dtype=UTF8)
+        g1.create_dataset('ClassIdToTest', shape=(0, 1), maxshape=(None, 1), chunks=(64, 1), dtype=np.int32)
+        g1.create_dataset('MaxCorrect', data=np.array([[self.max_correct]]))
+        g1.create_dataset('Timeout', data=np.array([[self.timeout]]))
+        g1.create_group('Data')
+
+    def write_trial(self, trial):
+        # Method to append a completed trial to the results file
+
+        g1 = self.h5['TrialLog']
+        class_id_to_test = g1['ClassIdToTest']
+        class_id_to_test.resize(trial + 1, axis=0)
+        class_id_to_test[trial, 0] = self.class_id_to_test[trial]
+
+        g3 = g1['Data'].create_group(str(trial))
+        n = self.num_samples[trial]
+        # Target names are looked up from the name table in a single indexing operation
+        # Variable length strings are only references into the heap, so they are not compressed
+        target_class = self._class_names[self.target_id[trial, :n]]
+        g3.create_dataset('targetClass', data=target_class.reshape(-1, 1), dtype=UTF8)
+        g3.create_dataset('classDecision', data=self.decision_id[trial, :n].reshape(-1, 1),
+                          **compressed_opts((n, 1)))
+
+        # Push the trial to disk now rather than at close
+        self.h5.flush()
+
+    def close_results(self):
+        # Method to close the results file, if open
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
 
-        g2 = g1.create_group('Data')
-
-        for i,d in enumerate(self.data):
-            g3 = g2.create_group(str(i))
-            encoded = [a.encode('utf8') for a in d['targetClass']]
-            g3.create_dataset('targetClass', shape=(len(encoded), 1), data=encoded)
-            g3.create_dataset('classDecision', shape=(len(d['classDecision']), 1), data=d['classDecision'])
+    def save_results(self):
+        # Method to finish saving assessment results in h5df format, following full assessment
+        # Trials have already been written by write_trial, so this just closes out the file
 
-        h5.close()
+        self.close_results()
         self.send_status('Saved ' + self.filename)
 
         # Clear data for next assessment
@@ -360,18 +537,28 @@ class TargetAchievementControl(AssessmentInterface):
         self.repetitions = 2  # Repetitions per joint
         self.timeout = 45.0  # Time before assessment failed
         self.dwell_time = 2.0  # Time required within target position
+        self.status_interval = 0.5  # Minimum time between repeated progress status messages
 
         # Data storage
         self.target_joint = []  # Joint or grasp id
         self.target_position = []  # Target position in degrees (joints) or percentage (grasps)
         self.target_error = []
-        self.position_time_history = []  # Plant position
+        self.position_time_history = np.empty((0, 0))  # [sample, joint] plant position
         self.intent_time_history = []  # Intent at each test during assessment
-        self.time_history = []  # time list
+        self.time_history = np.empty(0)  # time of each sample
         self.completion_time = []  # completion time
         self.lower_limit = []
         self.upper_limit = []
-        self.data = []  # list of dicts
+        self.gui_scale = []  # GUI bar percent per unit of position for each joint
+        self.h5 = None  # Results file, open while an assessment is running
+        self.num_trials = 0  # Trials written to the results file
+
+        # Event set (on the assessment event loop) whenever the vie publishes a new class decision
+        self._loop = None
+        self._decision_event = None
+        self.vie.add_decision_handler(self.on_new_decision)
+        self._status_times = {}  # Time each rate limited status message was last sent, by key
+        self._rng = np.random.default_rng()  # Generator for target positions
 
         # Kill flag
         # self.stop_assessment = False  # deprecated for asyncio task.cancel()
@@ -381,13 +568,14 @@ class TargetAchievementControl(AssessmentInterface):
         self.target_joint = []  # Joint or grasp id
         self.target_position = []  # Target position in degrees (joints) or percentage (grasps)
         self.target_error = []  # Deviation from target position that is allowed
-        self.position_time_history = []  # Plant position
+        self.position_time_history = np.empty((0, 0))  # [sample, joint] plant position
         self.intent_time_history = []  # Intent at each test during assessment
-        self.time_history = []  # time list
+        self.time_history = np.empty(0)  # time of each sample
         self.completion_time = []  # completion time
         self.lower_limit = []
         self.upper_limit = []
-        self.data = []
+        self.gui_scale = []
+        self.num_trials = 0
 
     def command_string(self, value):
         """
@@ -400,10 +588,10 @@ class TargetAchievementControl(AssessmentInterface):
                 StartAssessment
         """
 
-        logging.info('Received new  TAC command:' + value)
+        logging.info('Received new  TAC command:%s', value)
         parsed = value.split(':')
         if not len(parsed) == 2:
-            logging.warning('Invalid TAC command: ' + value)
+            logging.warning('Invalid TAC command: %s', value)
             return
         else:
             cmd_type = parsed[0]
@@ -420,8 +608,10 @@ class TargetAchievementControl(AssessmentInterface):
                 self.target_error_degree = float(cmd_data.split('-')[4])
                 self.target_error_percent = float(cmd_data.split('-')[5])
 
-                if self.task is None:
+                if self.task is not None and not self.task.done():
                     # Only start if no tasks already running
+                    logging.warning('TAC already running')
+                else:
                     self.task = asyncio.create_task(self.run_assessment())
 
             elif 'StartTAC3' in cmd_data:
@@ -434,8 +624,10 @@ class TargetAchievementControl(AssessmentInterface):
                 self.target_error_degree = float(cmd_data.split('-')[4])
                 self.target_error_percent = float(cmd_data.split('-')[5])
 
-                if self.task is None:
+                if self.task is not None and not self.task.done():
                     # Only start if no tasks already running
+                    logging.warning('TAC already running')
+                else:
                     self.task = asyncio.create_task(self.run_assessment())
 
             elif 'StopTAC' in cmd_data:
@@ -467,9 +659,9 @@ class TargetAchievementControl(AssessmentInterface):
             await self.start_assessment()
             # print('TAC done - clearing task')
             self.clear_task()
-        except asyncio.CancelledError:
-            # print('TAC Cancelled')
-            raise
+        finally:
+            # Close the file however the assessment ends, so an abort or error keeps trials already completed
+            self.close_results()
 
     async def start_assessment(self):
         # condition should be
@@ -480,6 +672,9 @@ class TargetAchievementControl(AssessmentInterface):
         # Set condition specific parameters
         self.filename = self.assessment_type + '_LOG'  # e.g. TAC1_LOG or TAC3_LOG
 
+        # Wake on class decision changes
+        self.create_decision_event()
+
         # Determine which classes have been trained
         all_class_names = self.vie.TrainingData.motion_names
         totals = self.vie.TrainingData.get_totals()
@@ -506,12 +701,8 @@ class TargetAchievementControl(AssessmentInterface):
 
         # We will only assess joints where both directions have been trained
         # Logic used here will be simply to see if there are two instances of given joint id in all_joint_ids
-        from collections import Counter
         d = Counter(all_joint_ids)
-        trained_joints = []
-        for joint, count in d.items():
-            if count > 1 and joint is not None:
-                trained_joints.append(joint)
+        trained_joints = [joint for joint, count in d.items() if count > 1 and joint is not None]
 
         # We can assess any grasp, as long as 'Hand Open' has been trained
         if 'Hand Open' in trained_classes:
@@ -537,6 +728,7 @@ class TargetAchievementControl(AssessmentInterface):
             else:
                 self.send_status('ELBOW must be fully trained to begin TAC3. Stopping assessment.')
                 self.cancel_task()
+                return
 
             # Choose wrist motion, right now will just pick the first one
             if 'WRIST_ROT' in trained_joints:
@@ -551,6 +743,7 @@ class TargetAchievementControl(AssessmentInterface):
             else:
                 self.send_status('One WRIST DOF must be fully trained to begin TAC3. Stopping assessment.')
                 self.cancel_task()
+                return
 
             # Choose grasp
             if trained_grasps:
@@ -561,6 +754,10 @@ class TargetAchievementControl(AssessmentInterface):
                 msg = 'One GRASP as well as Hand Open must be fully trained to begin TAC3. Stopping assessment.'
                 self.send_status(msg)
                 self.cancel_task()
+                return
+
+        # Create the results file, each trial is written as it completes
+        self.open_results()
 
         # Assess joints and grasps
         for i_rep in range(self.repetitions):
@@ -586,6 +783,11 @@ class TargetAchievementControl(AssessmentInterface):
         timeout = self.timeout
         move_complete = False  # Flag for move completion
 
+        # Resolve joint enum indices once, grasps have no joint index so use 0 as a placeholder that is masked out
+        is_grasp_arr = np.array(is_grasp_list, dtype=bool)
+        joint_ids = np.array([0 if is_grasp_list[i] else int(getattr(MplId, joint_name))
+                              for i, joint_name in enumerate(joint_name_list)], dtype=np.intp)
+
         # Set joint-specific parameters
         target_error_list = []  # Error range allowed
         lower_limit_list = []  # Lower limit for joint
@@ -602,19 +804,12 @@ class TargetAchievementControl(AssessmentInterface):
                 # within limits.  Will ensure this position is at least 25% of total range from current position,
                 # and not at edge of limit
                 current_position = self.vie.Plant.grasp_position * 100.0
-                time_begin = time.time()
-                while True:
-                    target_position = float(random.randint(int(round(lower_limit_list[-1])), int(round(upper_limit_list[-1]))))
-                    condition1 = abs(current_position - target_position) > 0.25*(float(upper_limit_list[-1]) - float(lower_limit_list[-1]))
-                    condition2 = abs(target_position - float(upper_limit_list[-1])) > target_error_list[-1]
-                    condition3 = abs(target_position - float(lower_limit_list[-1])) > target_error_list[-1]
-                    if (condition1 and condition2 and condition3) or ((time.time() - time_begin) > 5):
-                        break
-                target_position_list.append(target_position)
+                target_position_list.append(draw_target_position(self._rng, current_position, lower_limit_list[-1],
+                                                                 upper_limit_list[-1], target_error_list[-1]))
 
             else:
                 target_error_list.append(float(self.target_error_degree))
-                mpl_id = getattr(MplId, joint_name)
+                mpl_id = joint_ids[i]
                 lower_limit_list.append(np.rad2deg(float(self.vie.Plant.lower_limit[mpl_id])))
                 upper_limit_list.append(np.rad2deg(float(self.vie.Plant.upper_limit[mpl_id])))
                 # Set target joint angle
@@ -622,16 +817,9 @@ class TargetAchievementControl(AssessmentInterface):
                 # within limits
                 # Will ensure this position is at least 25% of total range away from current position, and not at
                 # edge of limit
-                current_position = np.rad2deg(self.vie.Plant.joint_position[mpl_id])
-                time_begin = time.time()
-                while True:
-                    target_position = float(random.randint(int(round(lower_limit_list[-1])), int(round(upper_limit_list[-1]))))
-                    condition1 = abs(current_position - target_position) > 0.25 * (float(upper_limit_list[-1]) - float(lower_limit_list[-1]))
-                    condition2 = abs(target_position - float(upper_limit_list[-1])) > target_error_list[-1]
-                    condition3 = abs(target_position - float(lower_limit_list[-1])) > target_error_list[-1]
-                    if (condition1 and condition2 and condition3) or ((time.time() - time_begin) > 5):
-                        break
-                target_position_list.append(target_position)
+                current_position = float(np.rad2deg(self.vie.Plant.joint_position[mpl_id]))
+                target_position_list.append(draw_target_position(self._rng, current_position, lower_limit_list[-1],
+                                                                 upper_limit_list[-1], target_error_list[-1]))
 
         # Set data storage properties
         self.target_joint = joint_name_list
@@ -639,95 +827,99 @@ class TargetAchievementControl(AssessmentInterface):
         self.target_error = target_error_list
         self.lower_limit = lower_limit_list
         self.upper_limit = upper_limit_list
-        self.position_time_history = np.empty([0, len(joint_name_list)])  # Plant position
-        self.intent_time_history = []
+        self.gui_scale = 100.0 / (np.array(upper_limit_list) - np.array(lower_limit_list))
+        gui_lower = np.array(lower_limit_list)
+        gui_bars = np.empty(len(joint_name_list))  # Reused GUI bar positions
         self.completion_time = -1.0
-        self.time_history = []  # time list
-        position_row = np.empty([1, len(joint_name_list)])
+
+        # Preallocate sample history for the timeout, buffers are doubled if waiting for the user to start runs long
+        num_samples = 0
+        max_samples = int(np.ceil(timeout / dt)) + 1
+        position_history = np.empty([max_samples, len(joint_name_list)])  # Plant position
+        intent_history = np.empty(max_samples, dtype=object)  # Intent at each test during assessment
+        time_history = np.empty(max_samples)  # time list
 
         # Update web gui
         self.update_gui_joint_target(self._condition)
 
         time_elapsed = 0.0
         time_in_target = 0.0
-        joint_in_target = [False] * len(joint_name_list)
+        last_status = (None, None)  # (dwell time, grasp) shown in the last progress status message
+        joint_in_target = np.zeros(len(joint_name_list), dtype=bool)
+        target_positions = np.array(target_position_list)
+        target_errors = np.array(target_error_list)
+        grasp_indices = [i for i, is_grasp in enumerate(is_grasp_list) if is_grasp]
         start_sequence = True
-        entered_no_movement = False
+        movement_start = MovementStart()
 
         if self.assessment_type == 'TAC3':
             prefix = 'Testing Joint(s):<br>'
         else:
             prefix = 'Testing Joint:<br>'
-        msg = prefix + '<b>' + ', '.join(joint_name_list) + '</b><br>Return to "No Movement" to Begin'
+        joint_names = ', '.join(joint_name_list)
+        msg = prefix + '<b>' + joint_names + '</b><br>Return to "No Movement" to Begin'
         self.send_status(msg)
-        while not move_complete and (time_elapsed < timeout):
 
-            # Loop through each joint we are assessing simultaneously
-            for i, joint_name in enumerate(joint_name_list):
+        # Bind objects used every sample.  Note vie.output is replaced each vie update so it can't be bound here
+        vie = self.vie
+        plant = vie.Plant
 
-                is_grasp = is_grasp_list[i]
-                target_position = target_position_list[i]
-                target_error = target_error_list[i]
+        while not move_complete and (time_elapsed < timeout):
 
-                # Get current joint position
-                if is_grasp:
-                    position = self.vie.Plant.grasp_position*100.0
-                else:
-                    mpl_id = getattr(MplId, joint_name)
-                    position = np.rad2deg(self.vie.Plant.joint_position[mpl_id])
-
-                # If within +- target_error of target_position, then flag this joint as within target
-                if (position < (target_position + target_error)) and (position > (target_position - target_error)):
-                    joint_in_target[i] = True
-                    if is_grasp:
-                        # Need an additional check if we are checking a grasp to make sure it is correct grasp that is
-                        # falling within grasp percentage
-                        if joint_name is not self.vie.Plant.grasp_id:
-                            joint_in_target[i] = False
-                else:
+            if num_samples == len(time_history):
+                position_history = np.concatenate((position_history, np.empty_like(position_history)))
+                intent_history = np.concatenate((intent_history, np.empty_like(intent_history)))
+                time_history = np.concatenate((time_history, np.empty_like(time_history)))
+
+            # Get current position of all joints we are assessing simultaneously, directly into the history
+            positions = position_history[num_samples]
+            self.sample_joint_positions(joint_ids, is_grasp_arr, positions)
+
+            # If within +- target_error of target_position, then flag this joint as within target
+            joints_in_target(positions, target_positions, target_errors, out=joint_in_target)
+            for i in grasp_indices:
+                # Need an additional check if we are checking a grasp to make sure it is correct grasp that is
+                # falling within grasp percentage
+                if joint_name_list[i] != plant.grasp_id:
                     joint_in_target[i] = False
 
-                # Update data storage properties for this joint
-                position_row[0, i] = position
-
             # Get current intent
-            current_class = self.vie.output['decision']
+            current_class = vie.output['decision']
 
             #  Update data storage properties for all joints
-            self.position_time_history = np.append(self.position_time_history, position_row, axis=0)  # Plant position
-            self.intent_time_history.append(current_class)  # Intent at each test during assessment
-            self.time_history.append(time_elapsed)  # time list
+            intent_history[num_samples] = current_class
+            time_history[num_samples] = time_elapsed
+            num_samples += 1
 
             # Update web gui
-            self.update_gui_joint(self._condition)
+            self.update_gui_joint(self._condition, positions, gui_lower, gui_bars)
 
             # Start once user goes to no-movement, then first non- no movement classification is given
             if start_sequence:
-                if current_class == 'No Movement':
-                    entered_no_movement = True
-                if (current_class != 'No Movement') and (current_class != 'None') and entered_no_movement:
+                # Clear with the decision read so a change published after this sample wakes the wait below
+                self._decision_event.clear()
+                if movement_start.update(current_class):
                     start_sequence = False
                     # First non-no movement command received.  Begin assessment
-                    time_begin = time.time()
+                    time_begin = time.monotonic()
+                    deadline = time_begin  # Time of the next sample
 
                 # TODO: add a start condition for grasps that hand is all the way open
-                # time.sleep(dt)  # Necessary to sleep, otherwise get output gets backlogged
-                await asyncio.sleep(dt)
+                # Keep sampling every dt while waiting, but resample immediately if the decision changes
+                await self.wait_for_decision(dt)
                 continue
 
-            # Output status
-            if self.assessment_type == 'TAC3':
-                prefix = 'Testing Joint(s):<br>'
-            else:
-                prefix = 'Testing Joint:<br>'
+            # Output status immediately when dwell time or grasp changes, otherwise only refresh the elapsed time
+            # every status_interval rather than formatting and sending a new message every sample
             # msg = prefix + '<b>' + ', '.join(joint_name_list) \
             #     + '</b><br>Dwell Time - ' + "{0:0.1f}".format(time_in_target) \
             #     + '<br>Elapsed Time - ' + "{0:0.1f}".format(time_elapsed)
-            msg = prefix + '<b>' + ', '.join(joint_name_list) \
-                + '</b><br>Dwell Time - ' + "{0:0.1f}".format(time_in_target) \
-                + '<br>Elapsed Time - ' + "{0:0.1f}".format(time_elapsed) \
-                + '<br>Current Grasp - ' + self.vie.Plant.grasp_id
-            self.send_status(msg)
+            status = (time_in_target, plant.grasp_id)
+            self.send_status_rate_limited('progress', '%s<b>%s</b><br>Dwell Time - %0.1f<br>Elapsed Time - %0.1f'
+                                                      '<br>Current Grasp - %s',
+                                          prefix, joint_names, time_in_target, time_elapsed, plant.grasp_id,
+                                          min_interval=self.status_interval, force=status != last_status)
+            last_status = status
 
             # Commented out, too cluttered for now, could potentially allow this output with verbose option
             # self.send_status('Testing Joint - ' + joint_name + ' - Current Position - ' + str(position) +
@@ -735,41 +927,49 @@ class TargetAchievementControl(AssessmentInterface):
             #                 ' - Time in Target - ' + str(time_in_target))
 
             # If all joints in target, increment time_in_target, otherwise reset to 0
-            if False in joint_in_target:
-                time_in_target = 0.0
-            else:
+            if joint_in_target.all():
                 time_in_target += dt
+            else:
+                time_in_target = 0.0
 
             # Exit criteria
             if time_in_target >= dwell_time:
                 move_complete = True
                 self.completion_time = time_elapsed  # completion time1
 
-            # Sleep before next assessed classification
-            time_elapsed = time.time() - time_begin
-            await asyncio.sleep(dt)
+            # Sleep before next assessed classification, falling back to now if the loop has overrun a sample
+            time_elapsed = time.monotonic() - time_begin
+            deadline = max(deadline + dt, time.monotonic())
+            await sleep_until(deadline)
             # time.sleep(dt)
 
         # Add data from current joint assessment
+        self.position_time_history = position_history[:num_samples]
+        self.intent_time_history = intent_history[:num_samples].tolist()
+        self.time_history = time_history[:num_samples]
         self.add_data()
 
-        self.send_status(', '.join(joint_name_list) + ' Assessment Completed')
+        self.send_status(joint_names + ' Assessment Completed')
 
         return move_complete
 
-    def update_gui_joint(self, num_dof):
+    def sample_joint_positions(self, joint_ids, is_grasp, positions):
+        # Fill the preallocated positions array with the current plant position of each assessed joint
+        # joint_ids are integer MplId values, is_grasp masks the entries that are grasps
+        # Joints are reported in degrees, grasps in percent closed
+        plant = self.vie.Plant
+        np.multiply(np.take(plant.joint_position, joint_ids), RAD2DEG, out=positions)
+        np.copyto(positions, plant.grasp_position * 100.0, where=is_grasp)
+
+    def update_gui_joint(self, num_dof, positions, lower_limit, bars):
         # Will set joint bar display on web interface
+        # positions is the latest recorded sample so we are displaying what is being recorded/tested
+        # lower_limit is the array of joint lower limits, bars is a scratch array for the bar positions
 
         # format message:
-        payload = str(num_dof)
-        for joint_num in range(num_dof):
-            # pull from position_time_history so we are displaying what is being recorded/tested
-            raw_pos = self.position_time_history[-1, joint_num]
-            normalized_joint_position = (raw_pos - self.lower_limit[joint_num]) / (
-                        self.upper_limit[joint_num] - self.lower_limit[joint_num]) * 100
-
-            payload += ",{bar:.2f}".format(
-                id=joint_num, bar=normalized_joint_position)
+        np.subtract(positions, lower_limit, out=bars)
+        bars *= self.gui_scale
+        payload = str(num_dof) + ''.join([',%.2f' % bar for bar in bars[:num_dof]])
         self.trainer.send_message("TAC_update", payload)
 
     def update_gui_joint_target(self, num_dof):
@@ -778,11 +978,9 @@ class TargetAchievementControl(AssessmentInterface):
         # format message:
         payload = str(num_dof)
         for joint_num in range(num_dof):
-            normalized_target_position = (self.target_position[joint_num] - self.lower_limit[joint_num]) / (
-                    self.upper_limit[joint_num] - self.lower_limit[joint_num]) * 100.0
-
-            normalized_target_error = (self.target_error[joint_num]) / (
-                    self.upper_limit[joint_num] - self.lower_limit[joint_num]) * 100.0
+            normalized_target_position = (self.target_position[joint_num] - self.lower_limit[joint_num]) * \
+                self.gui_scale[joint_num]
+            normalized_target_error = self.target_error[joint_num] * self.gui_scale[joint_num]
 
             payload += ",{name},{target:.2f},{error:.2f}".format(
                 name=self.target_joint[joint_num], target=normalized_target_position, error=normalized_target_error)
@@ -794,49 +992,53 @@ class TargetAchievementControl(AssessmentInterface):
         self.trainer.send_message("TAC_status", status)
 
     def add_data(self):
-        # Method to add data from single jon assessment to overall output data block
-
-        new_data_dict = {}
-        new_data_dict['target_joint'] = self.target_joint
-        new_data_dict['target_position'] = self.target_position
-        new_data_dict['target_error'] = self.target_error
-        new_data_dict['position_time_history'] = self.position_time_history
-        new_data_dict['intent_time_history'] = self.intent_time_history
-        new_data_dict['time_history'] = self.time_history
-        new_data_dict['completion_time'] = self.completion_time
-        new_data_dict['lower_limit'] = self.lower_limit
-        new_data_dict['upper_limit'] = self.upper_limit
-
-        self.data.append(new_data_dict)
-
-    def save_results(self):
-        # Method to save out compiled assessment results in h5df formal, following full assessment
-
-        t = dtime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        # Method to append data from single joint assessment to the results file
+
+        g2 = self.h5['Data'].create_group('Trial ' + str(self.num_trials + 1))
+        target_joint = np.array(self.target_joint, dtype=UTF8).reshape(-1, 1)
+        g2.create_dataset('target_joint', data=target_joint, dtype=UTF8)
+        g2.create_dataset('target_position', data=self.target_position, shape=(len(self.target_position), 1))
+        g2.create_dataset('target_error', data=self.target_error, shape=(len(self.target_error), 1))
+        # Sample logs are stored as rows (MATLAB convention) and numeric logs compressed
+        intent_time_history = np.array(self.intent_time_history, dtype=UTF8).reshape(1, -1)
+        g2.create_dataset('intent_time_history', data=intent_time_history, dtype=UTF8)
+        position_time_history = np.ascontiguousarray(self.position_time_history.transpose())
+        g2.create_dataset('position_time_history', data=position_time_history,
+                          **compressed_opts(position_time_history.shape))
+        time_history = np.asarray(self.time_history).reshape(1, -1)
+        g2.create_dataset('time_history', data=time_history, **compressed_opts(time_history.shape))
+        g2.create_dataset('completion_time', data=[self.completion_time], shape=(1, 1))
+        self.num_trials += 1
+
+        # Push the trial to disk now rather than at close
+        self.h5.flush()
+
+    def open_results(self):
+        # Method to create the results file at the start of an assessment, trials are then written as they complete
+        # so an aborted assessment keeps all completed trials
+
+        t = time.strftime("%Y-%m-%d_%H-%M-%S")
         f = t + '_' + self.filename + self.file_ext
         counter = 1
         while os.path.exists(f):
             f = t + '_' + self.filename + str(counter) + self.file_ext
             counter = counter + 1
-        h5 = h5py.File(f, 'w')
-        g1 = h5.create_group('Data')
-        g1.attrs['description'] = t + 'TAC' + str(self._condition)+ ' Data'
-
-        for i, d in enumerate(self.data):
-            g2 = g1.create_group('Trial ' + str(i+1))
-            encoded = [a.encode('utf8') for a in d['target_joint']] # Need to encode strings
-            g2.create_dataset('target_joint', shape=(len(encoded), 1), data=encoded)
-            g2.create_dataset('target_position', data=d['target_position'], shape=(len(d['target_position']), 1))
-            g2.create_dataset('target_error', data=d['target_error'], shape=(len(d['target_error']), 1))
-            encoded = [a.encode('utf8') for a in d['intent_time_history']]
-            g2.create_dataset('intent_time_history', shape=(1, len(d['intent_time_history'])), data=encoded)
-            g2.create_dataset('position_time_history', shape=d['position_time_history'].shape[::-1],
-                              data=d['position_time_history'].transpose())
-            g2.create_dataset('time_history', shape=(1, len(d['time_history'])),
-                              data=d['time_history'])
-            g2.create_dataset('completion_time', data=[d['completion_time']], shape=(1,1))
-
-        h5.close()
+        self.h5 = h5py.File(f, 'w', rdcc_nbytes=RDCC_NBYTES, rdcc_nslots=RDCC_NSLOTS)
+        g1 = self.h5.create_group('Data')
+        g1.attrs['description'] = t + 'TAC' + str(self._condition) + ' Data'
+        self.num_trials = 0
+
+    def close_results(self):
+        # Method to close the results file, if open
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
+
+    def save_results(self):
+        # Method to finish saving assessment results in h5df format, following full assessment
+        # Trials have already been written by add_data, so this just closes out the file
+
+        self.close_results()
         self.send_status('Saved ' + self.filename)
 
         # Clear data for next assessment
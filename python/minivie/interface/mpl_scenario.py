@@ -63,6 +63,7 @@ class MplScenario(object):
         # Create a buffer for storing recent class decisions for majority voting
         self.decision_buffer = deque([], get_user_config_var('PatternRec.num_majority_votes', 25))
         self.last_decision = None
+        self.decision_handlers = []  # list of callbacks notified when the class decision changes
 
         self.output = None  # Will contain latest status message
 
@@ -254,6 +255,8 @@ class MplScenario(object):
         if class_decision != self.last_decision:
             logging.info(f'New Class Decision: {class_decision}')
             self.last_decision = class_decision
+            for func in self.decision_handlers:
+                func(class_decision)
 
         # parse decision type as arm, grasp, etc
         class_info = controls.plant.class_map(class_decision)
@@ -557,6 +560,13 @@ class MplScenario(object):
                 log = logging.getLogger()
                 log.exception('Error from DCELL:')
 
+    def add_decision_handler(self, func):
+        # attach a function to be called with the new class decision whenever it changes
+        # Note handlers are called from the vie loop thread, so they must be thread safe and return quickly
+
+        if func not in self.decision_handlers:
+            self.decision_handlers.append(func)
+
     def attach_source(self, input_source):
         # Pass in a list of signal sources and they will be added to the scenario
 
@@ -16,6 +16,10 @@ import mpl.extract_percepts
 import controls
 
 
+# Command message header: uint16 MSG_LENGTH + uint8 MSG_TYPE + uint8 msg_id
+COMMAND_HEADER = struct.Struct('HBB')
+
+
 class AutoNumber(Enum):
     # While Enum, IntEnum, IntFlag, and Flag are expected to cover the majority of use-cases,
     # they cannot cover them all. Here are recipes for some different types of enumerations
@@ -177,14 +181,9 @@ def encode_position_velocity_impedance_command(position, velocity, impedance):
     # imp = [256*ones(1,4) 256*ones(1,3) 0.5*ones(1,20)];
 
     # PVI Command
-    payload = np.append(position, velocity)
-    payload = np.append(payload, impedance)
-
     # uint16 MSG_LENGTH + uint8 MSG_TYPE + 1 msg_id + payload + checksum
-    packer = struct.Struct('HBB81f')
-
     # 327 message length equals 27 joint angles * 3 PVI params * 4 bytes per float + 2 header bytes + 1 checksum byte
-    msg_bytes = bytearray(packer.pack(327, 5, 8, *payload))
+    msg_bytes = encode_float_command(327, 8, 81, position, velocity, impedance)
     return encode_checksum(msg_bytes)
 
 
@@ -197,13 +196,9 @@ def encode_position_velocity_command(position, velocity):
     @return: Python string of encoded bytes
     """
     # PV Command
-    payload = np.append(position, velocity)
-
     # uint16 MSG_LENGTH + uint8 MSG_TYPE + 1 msg_id + payload + checksum
-    packer = struct.Struct('HBB54f')
-
     # 219 message length equals 27 joint angles * 2 PV params * 4 bytes per float + 2 header bytes + 1 checksum byte
-    msg_bytes = bytearray(packer.pack(219, 5, 1, *payload))
+    msg_bytes = encode_float_command(219, 1, 54, position, velocity)
     return encode_checksum(msg_bytes)
 
 
@@ -241,6 +236,28 @@ def encode_cmd_state_limb_soft_reset():
     return encode_checksum(bytearray([3, 0, 11, 11]))
 
 
+def encode_float_command(msg_length, msg_id, num_floats, *fields):
+    """
+    Formats a command message header followed by a block of float32 values
+
+    The fields are joined and converted to float32 in one numpy operation, rather than passing each value to
+    struct.pack as a separate argument
+
+    @param msg_length: uint16 message length, in bytes, following the length field
+    @param msg_id: uint8 message id
+    @param num_floats: expected total number of float values across all fields
+    @param fields: array-like float fields (e.g. position, velocity, impedance) in transmission order
+    @return: Python bytearray of header and float payload, without checksum
+    """
+    payload = np.concatenate([np.ravel(field) for field in fields]).astype(np.float32)
+    if payload.size != num_floats:
+        raise struct.error('Expected {} command values, got {}'.format(num_floats, payload.size))
+
+    msg_bytes = bytearray(COMMAND_HEADER.pack(msg_length, 5, msg_id))
+    msg_bytes.extend(payload.tobytes())
+    return msg_bytes
+
+
 def encode_checksum(payload):
     """
     Adds the expected checksum to the formatted message bytes
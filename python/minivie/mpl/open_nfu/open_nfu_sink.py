@@ -175,8 +175,10 @@ class NfuSink(DataSink):
             velocity = [0.0] * mpl.JointEnum.NUM_JOINTS
 
         # 1/10/2020 RSA: Further compressed 0.00 to 0, others to 2 decimal places
-        log_msg = 'CmdAngles: ' + ','.join(['0' if elem == 0 else '%.2f' % elem for elem in values])
-        logging.info(log_msg)
+        # Only format the angles when the message will be logged, this is called for every limb command
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            log_msg = 'CmdAngles: ' + ','.join(['0' if elem == 0 else '%.2f' % elem for elem in values])
+            logging.info(log_msg)
 
         values = np.array(values) + self.joint_offset
 
@@ -213,11 +213,13 @@ class UnityUdp(udp_comms.Udp, DataSink):
         # Send data
         rad_to_deg = 57.2957795  # 180/pi
         # log command in degrees as this is the most efficient way to pack data
-        msg = 'JointCmd: ' + ','.join(['%d' % int(elem*rad_to_deg) for elem in values])
-        logging.debug(msg)  # 60 us
+        # Building the message takes ~60 us, so only do it when debug logging is on
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            msg = 'JointCmd: ' + ','.join(['%d' % int(elem*rad_to_deg) for elem in values])
+            logging.debug(msg)
 
-        packer = struct.Struct('27f')
-        packed_data = packer.pack(*values)
+        # Pack as 27 native float32 values ('27f') in one numpy conversion rather than one struct argument per joint
+        packed_data = values.astype(np.float32).tobytes()
         if self._is_connected:
             if send_to_ghost:
                 self.send(packed_data, (self.remote_hostname, self.command_port))
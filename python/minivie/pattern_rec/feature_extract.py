@@ -52,17 +52,17 @@ class FeatureExtract(object):
             data = np.concatenate([s.get_data() for s in data_input], axis=1)
             f = np.squeeze(self.feature_extract(data * 0.01))
 
-            imu = np.array([])
-            for s in data_input:
-                if hasattr(s, 'get_imu'):
+            # Gather the imu parts and join them once, rather than reallocating the array for each np.append
+            if all(hasattr(s, 'get_imu') for s in data_input):
+                imu_parts = []
+                for s in data_input:
                     result = s.get_imu()
-                    imu = np.append(imu, result['quat'])
-                    imu = np.append(imu, result['accel'])
-                    imu = np.append(imu, result['gyro'])
-                    # add imu to features
-                    # f = np.append(f, imu)
-                else:
-                    imu = float('nan')
+                    imu_parts.extend((np.ravel(result['quat']), np.ravel(result['accel']), np.ravel(result['gyro'])))
+                imu = np.concatenate(imu_parts)
+                # add imu to features
+                # f = np.append(f, imu)
+            else:
+                imu = float('nan')
 
             rot_mat = []
             for s in data_input:
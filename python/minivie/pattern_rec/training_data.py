@@ -2,8 +2,10 @@ import csv
 import datetime as dt
 import logging
 import os
+import sys
 import threading
 import time
+from collections import Counter
 from shutil import copyfile
 
 import h5py
@@ -21,7 +23,8 @@ class TrainingData:
         # self.motion_names = 'No Movement'
         # TODO: Eliminate separate list for motion names
         # Names of potentially trained classes
-        self.motion_names = (
+        # Names are interned so class decisions taken from this list compare by identity against interned constants
+        self.motion_names = tuple(map(sys.intern, (
             'No Movement',
             'Shoulder Flexion', 'Shoulder Extension',
             'Shoulder Adduction', 'Shoulder Abduction',
@@ -48,11 +51,14 @@ class TrainingData:
             'Hang Loose',
             'Thumbs Up',
             'Peace',
-        )
+        )))
 
         # Create lock to control write access to training data
         self.__lock = threading.Lock()
 
+        # Motion name to image file map, parsed from the map file on first use
+        self.__motion_image_map = None
+
         self.num_channels = 0
         # TODO: For now this was missing a split on comma.  Future should get features based on what is enabled
         # self.features = get_user_config_var("features", "Mav,Curve_Len,Zc,Ssc").split()
@@ -100,7 +106,7 @@ class TrainingData:
 
     def add_class(self, new_class):
         if new_class not in self.motion_names:
-            self.motion_names = tuple(list(self.motion_names) + [new_class])
+            self.motion_names = tuple(list(self.motion_names) + [sys.intern(new_class)])
             return True
         else:
             logging.info('Error, "' + new_class + '" already contained in class list.')
@@ -126,10 +132,11 @@ class TrainingData:
         num_motions = len(self.motion_names)
 
         if motion_id is None:
-            total = [0] * num_motions
+            # Count all ids in a single pass rather than scanning the sample list once per motion
+            counts = Counter(self.id)
+            total = [counts[c_] for c_ in range(num_motions)]
             for c_ in range(num_motions):
-                total[c_] = self.id.count(c_)
-                logging.debug('{} [{}]'.format(self.motion_names[c_],total[c_]))
+                logging.debug('%s [%d]', self.motion_names[c_], total[c_])
         else:
             total = self.id.count(motion_id)
 
@@ -257,22 +264,24 @@ class TrainingData:
             logging.info('Motion name ' + motion_name + ' does not exist')
             return None
 
-        # Parse motion name - image map file
-        map_path = os.path.join(os.path.dirname(__file__), '..', '..', 'www', 'mplHome', 'motion_name_image_map.csv')
-        mapped_motion_names = []
-        mapped_image_names = []
-        with open(map_path, 'rt', encoding='ascii') as csvfile:
-            # RSA: Updated to allow comments in motion_name_image_map file
-            rows = csv.reader(filter(lambda row: row[0] != '#', csvfile), delimiter=',')
-            for this_row in rows:
-                mapped_motion_names.append(this_row[0])
-                mapped_image_names.append(this_row[1])
+        # Parse motion name - image map file once, it does not change while running
+        if self.__motion_image_map is None:
+            map_path = os.path.join(os.path.dirname(__file__), '..', '..', 'www', 'mplHome',
+                                    'motion_name_image_map.csv')
+            motion_image_map = {}
+            with open(map_path, 'rt', encoding='ascii') as csvfile:
+                # RSA: Updated to allow comments in motion_name_image_map file
+                rows = csv.reader(filter(lambda row: row[0] != '#', csvfile), delimiter=',')
+                for this_row in rows:
+                    # First entry for a motion name is used
+                    motion_image_map.setdefault(this_row[0], this_row[1])
+            self.__motion_image_map = motion_image_map
 
         # Check if queried motion name is in map file
-        if motion_name not in mapped_motion_names:
+        if motion_name not in self.__motion_image_map:
             logging.info('Motion name ' + motion_name + ' does not have associated image file')
             return None
 
         # Pull mapped image name corresponding to motion name
-        image_name = mapped_image_names[mapped_motion_names.index(motion_name)]
+        image_name = self.__motion_image_map[motion_name]
         return image_name
\ No newline at end of file
@@ -7,6 +7,14 @@ import time
 import keyboard
 import mouse
 
+# Relative mouse movement (x, y) for each decision
+MOUSE_MOVES = {
+    'Left': (-5, 0),
+    'Right': (+5, 0),
+    'Up': (0, -5),
+    'Down': (0, +5),
+}
+
 
 class VieOutput(object):
     def __init__(self):
@@ -27,16 +35,11 @@ class VieOutput(object):
         if not self.enabled:
             return
 
-        if decision is 'No Movement':
-            pass
-        elif decision is 'Left':
-            mouse.move(-5, 0, absolute=False)
-        elif decision is 'Right':
-            mouse.move(+5, 0, absolute=False)
-        elif decision is 'Up':
-            mouse.move(0, -5, absolute=False)
-        elif decision is 'Down':
-            mouse.move(0, +5, absolute=False)
+        # Compare by value with a single dict lookup.  'is' only matched when both strings happened to be interned
+        # No Movement and unknown decisions don't move the mouse
+        move = MOUSE_MOVES.get(decision)
+        if move is not None:
+            mouse.move(*move, absolute=False)
 
 
 def parse_arguments():
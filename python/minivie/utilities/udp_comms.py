@@ -22,6 +22,7 @@ class Udp(threading.Thread):
         threading.Thread.__init__(self)
         self._run_control = False  # Used by the start and terminate methods to control thread
         self.read_buffer_size = 1024
+        self.receive_buffer_size = 1 << 20  # kernel socket buffer (SO_RCVBUF), absorbs bursts while handlers are busy
         self.sock = None
 
         self.local_addr = local_address
@@ -54,6 +55,8 @@ class Udp(threading.Thread):
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)  # Enable broadcasting
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer_size)
+        logging.debug(f'Udp receive buffer size: {self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)}')
         self.sock.bind(self.local_addr)
         self.sock.settimeout(self.timeout)
         self._is_connected = True